@@ -0,0 +1,42 @@
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from pydantic import BaseModel
+from app.api.routes.auth import get_current_user_id
+from app.services.account_service import AccountService
+
+router = APIRouter()
+
+class AccountSubscription(BaseModel):
+    id: int
+    plan_type: Optional[str] = None
+    is_active: bool
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+
+class AccountUsage(BaseModel):
+    period_start: date
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    images: int
+    tts_characters: int
+
+class AccountResponse(BaseModel):
+    id: int
+    username: str
+    email: str
+    created_at: Optional[datetime] = None
+    plan: str
+    subscription: Optional[AccountSubscription] = None
+    content_count: int
+    last_content_at: Optional[datetime] = None
+    usage: AccountUsage
+
+@router.get("", response_model=AccountResponse)
+async def get_me(user_id: int = Depends(get_current_user_id)):
+    """Everything the dashboard needs about the current user, in one call"""
+    summary = await AccountService.get_summary(user_id)
+    if summary is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return summary
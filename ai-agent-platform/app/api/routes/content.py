@@ -0,0 +1,58 @@
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from pydantic import BaseModel
+from app.db.database import get_async_db
+from app.api.routes.auth import get_current_user_id
+from app.services.content_service import list_contents, search_contents
+
+router = APIRouter()
+
+class ContentItem(BaseModel):
+    id: int
+    content_type: Optional[str] = None
+    file_path: Optional[str] = None
+    prompt: Optional[str] = None
+    created_at: datetime
+
+class ContentPage(BaseModel):
+    items: List[ContentItem]
+    next_cursor: Optional[str] = None
+
+class SearchResult(ContentItem):
+    snippet: Optional[str] = None
+    score: float
+
+class SearchPage(BaseModel):
+    items: List[SearchResult]
+    next_offset: Optional[int] = None
+
+@router.get("", response_model=ContentPage)
+async def get_content_history(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """The current user's generated content, newest first; pass ``next_cursor`` back to get the next page"""
+    try:
+        rows, next_cursor = await list_contents(db, user_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": [dict(row._mapping) for row in rows], "next_cursor": next_cursor}
+
+@router.get("/search", response_model=SearchPage)
+async def search_content_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Search the current user's prompts and generated text, best matches first"""
+    try:
+        rows, next_offset = await search_contents(db, user_id, q, limit, offset)
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return {"items": [dict(row._mapping) for row in rows], "next_offset": next_offset}
@@ -1,21 +1,26 @@
 from fastapi import Request
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db, get_async_write_db
 from app.models.models import User, Subscription
 from datetime import datetime, timedelta
 from typing import Optional
 from pydantic import BaseModel
-import os
-import stripe
-from dotenv import load_dotenv
+from app.core.executors import run_blocking
+from app.core.lazy import LazyModule
+from app.core.metrics import metrics
+from app.services.account_service import AccountService
+from app.services.entitlement_service import EntitlementService
+from app.services.stripe_event_service import record_event, stripe_event_consumer
+from app.core.config import settings
 
-load_dotenv()
 
 router = APIRouter()
 
-# Initialize Stripe
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# Stripe's SDK is slow to import, so it is loaded on first use and configured then
+stripe_sdk = LazyModule("stripe", configure=lambda stripe: setattr(stripe, "api_key", settings.stripe_secret_key))
 
 class SubscriptionCreate(BaseModel):
     plan_type: str
@@ -27,24 +32,22 @@ class SubscriptionResponse(BaseModel):
     is_active: bool
     start_date: datetime
     end_date: Optional[datetime] = None
+
+async def get_active_subscription(db: AsyncSession, user_id: int):
+    result = await db.execute(select(Subscription).where(
+        Subscription.user_id == user_id,
+        Subscription.is_active == True
+    ))
+    return result.scalars().first()
     
 @router.post("/create", response_model=SubscriptionResponse)
-async def create_subscription(sub: SubscriptionCreate, db: Session = Depends(get_db)):
+async def create_subscription(sub: SubscriptionCreate, db: AsyncSession = Depends(get_async_write_db)):
     """Create a free trial subscription"""
     # Check if user exists
-    user = db.query(User).filter(User.id == sub.user_id).first()
+    user = await db.get(User, sub.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Check if user already has an active subscription
-    existing_sub = db.query(Subscription).filter(
-        Subscription.user_id == sub.user_id,
-        Subscription.is_active == True
-    ).first()
-    
-    if existing_sub:
-        raise HTTPException(status_code=400, detail="User already has an active subscription")
-    
     # Create trial subscription (valid for 7 days)
     end_date = datetime.utcnow() + timedelta(days=7)
     new_sub = Subscription(
@@ -55,20 +58,25 @@ async def create_subscription(sub: SubscriptionCreate, db: Session = Depends(get
         end_date=end_date
     )
     
+    # The one-active-subscription-per-user index rejects a second active row,
+    # so concurrent requests cannot both insert
     db.add(new_sub)
-    db.commit()
-    db.refresh(new_sub)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="User already has an active subscription")
+    await db.refresh(new_sub)
+    EntitlementService.invalidate(sub.user_id)
+    AccountService.invalidate(sub.user_id)
     
     return new_sub
 
 @router.get("/status/{user_id}", response_model=SubscriptionResponse)
-async def get_subscription_status(user_id: int, db: Session = Depends(get_db)):
+async def get_subscription_status(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get user's subscription status"""
     # Get user's active subscription
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == user_id,
-        Subscription.is_active == True
-    ).first()
+    subscription = await get_active_subscription(db, user_id)
     
     if not subscription:
         raise HTTPException(status_code=404, detail="No active subscription found")
@@ -76,10 +84,10 @@ async def get_subscription_status(user_id: int, db: Session = Depends(get_db)):
     return subscription
 
 @router.post("/create-checkout-session/{user_id}")
-async def create_checkout_session(user_id: int, plan_type: str, db: Session = Depends(get_db)):
+async def create_checkout_session(user_id: int, plan_type: str, db: AsyncSession = Depends(get_async_db)):
     """Create Stripe checkout session for subscription"""
     # Check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -87,17 +95,19 @@ async def create_checkout_session(user_id: int, plan_type: str, db: Session = De
     try:
         # Define price IDs based on plan type (these should be configured in your Stripe account)
         price_ids = {
-            "basic": os.getenv("STRIPE_BASIC_PRICE_ID", "price_basic_placeholder"),  
-            "premium": os.getenv("STRIPE_PREMIUM_PRICE_ID", "price_premium_placeholder")
+            "basic": settings.stripe_basic_price_id,  
+            "premium": settings.stripe_premium_price_id
         }
         
         if plan_type not in price_ids:
             raise HTTPException(status_code=400, detail="Invalid plan type")
         
-        success_url = os.getenv("FRONTEND_URL", "http://localhost:8501") + "/success?session_id={CHECKOUT_SESSION_ID}"
-        cancel_url = os.getenv("FRONTEND_URL", "http://localhost:8501") + "/cancel"
+        success_url = settings.frontend_url + "/success?session_id={CHECKOUT_SESSION_ID}"
+        cancel_url = settings.frontend_url + "/cancel"
         
-        checkout_session = stripe.checkout.Session.create(
+        stripe = await stripe_sdk.load()
+        checkout_session = await run_blocking(
+            stripe.checkout.Session.create,
             payment_method_types=["card"],
             line_items=[
                 {
@@ -109,6 +119,9 @@ async def create_checkout_session(user_id: int, plan_type: str, db: Session = De
             success_url=success_url,
             cancel_url=cancel_url,
             client_reference_id=str(user_id),
+            # Lets the webhook consumer attribute the checkout and later subscription events
+            metadata={"plan_type": plan_type},
+            subscription_data={"metadata": {"plan_type": plan_type, "user_id": str(user_id)}},
         )
         
         return {"checkout_url": checkout_session.url}
@@ -117,58 +130,30 @@ async def create_checkout_session(user_id: int, plan_type: str, db: Session = De
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/webhook")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
-    """Handle Stripe webhook events"""
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Verify a Stripe webhook event, store it in the inbox and acknowledge immediately.
+
+    The stripe event consumer applies stored events in the background, so
+    Stripe's retries of an already stored event id are acknowledged without
+    repeating any work.
+    """
     # Get the webhook payload
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
+    stripe = await stripe_sdk.load()
     
     try:
         # Verify the webhook signature
-        webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+        webhook_secret = settings.stripe_webhook_secret
         event = stripe.Webhook.construct_event(payload, sig_header, webhook_secret)
-        
-        # Handle the checkout.session.completed event
-        if event["type"] == "checkout.session.completed":
-            session = event["data"]["object"]
-            
-            # Get client_reference_id (user_id)
-            client_reference_id = session.get("client_reference_id")
-            if not client_reference_id:
-                return {"status": "error", "message": "No client reference ID found"}
-            
-            user_id = int(client_reference_id)
-            
-            # Update subscription in database
-            subscription = db.query(Subscription).filter(
-                Subscription.user_id == user_id,
-                Subscription.is_active == True
-            ).first()
-            
-            if subscription:
-                # Update existing subscription
-                subscription.stripe_customer_id = session.get("customer")
-                subscription.stripe_subscription_id = session.get("subscription")
-                # Set end date to 1 year from now for paid subscriptions
-                subscription.end_date = datetime.utcnow() + timedelta(days=365)
-            else:
-                # Create new subscription
-                new_subscription = Subscription(
-                    user_id=user_id,
-                    plan_type="premium",  # You might want to get this from the session
-                    is_active=True,
-                    start_date=datetime.utcnow(),
-                    end_date=datetime.utcnow() + timedelta(days=365),
-                    stripe_customer_id=session.get("customer"),
-                    stripe_subscription_id=session.get("subscription")
-                )
-                db.add(new_subscription)
-            
-            db.commit()
-            
-            return {"status": "success"}
-        
-        return {"status": "ignored", "type": event["type"]}
+    except (ValueError, stripe.SignatureVerificationError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid webhook: {str(e)}")
     
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    stored = await record_event(db, event["id"], event["type"], payload.decode("utf-8"))
+    if not stored:
+        metrics.incr("stripe.events_duplicate")
+        return {"status": "duplicate", "id": event["id"]}
+    
+    metrics.incr("stripe.events_received")
+    stripe_event_consumer.wake()
+    return {"status": "received", "id": event["id"]}
@@ -0,0 +1,141 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+
+from app.core.metrics import metrics
+from app.core.scheduling import WeightedFairQueue
+from app.core.config import settings
+
+
+UPSTREAM_MAX_CONCURRENCY = settings.upstream_max_concurrency
+UPSTREAM_MAX_QUEUE = settings.upstream_max_queue
+
+# Longest a request to each endpoint may wait for an upstream slot, in seconds
+DEFAULT_ENDPOINT_BUDGETS = {
+    "generate-image": 20.0,
+    "generate-code": 10.0,
+    "generate-document": 10.0,
+    "generate-presentation": 15.0,
+    "text-to-speech": 10.0,
+}
+DEFAULT_BUDGET = 10.0
+ENDPOINT_BUDGETS = {**DEFAULT_ENDPOINT_BUDGETS, **settings.admission_budgets}
+
+# Share of upstream slots per plan when callers are queued
+DEFAULT_PLAN_WEIGHTS = {"free": 1.0, "basic": 2.0, "premium": 4.0}
+PLAN_WEIGHTS = {**DEFAULT_PLAN_WEIGHTS, **settings.plan_weights}
+# Anyone queued longer than this is served next regardless of weight
+STARVATION_AFTER = settings.scheduler_starvation_after
+
+
+class Overloaded(HTTPException):
+    """503 raised when an upstream call cannot start within its latency budget"""
+
+    def __init__(self, detail, retry_after=1.0):
+        super().__init__(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded, weighted-fair queue in front of the upstream API.
+
+    Requests past the concurrency limit queue for a slot in per-caller
+    sub-queues, served by weighted fair queueing on the caller's plan weight
+    (see WeightedFairQueue). A request is rejected straight away when the
+    queue is full or when its expected wait (entries ahead of it x smoothed
+    service time / concurrency) already exceeds its endpoint's budget, and
+    rejected when its budget runs out while queued.
+    """
+
+    def __init__(self, max_concurrency=UPSTREAM_MAX_CONCURRENCY, max_queue=UPSTREAM_MAX_QUEUE, budgets=None,
+                 starvation_after=STARVATION_AFTER):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.budgets = ENDPOINT_BUDGETS if budgets is None else budgets
+        self.active = 0
+        self._queue = WeightedFairQueue(starvation_after=starvation_after)
+        # Smoothed time a call holds a slot, seeded with a conservative guess
+        self.service_time = 2.0
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def budget_for(self, endpoint):
+        return float(self.budgets.get(endpoint, DEFAULT_BUDGET))
+
+    def estimated_wait(self, ahead=None):
+        if self.active < self.max_concurrency and not self._queue:
+            return 0.0
+        ahead = len(self._queue) if ahead is None else ahead
+        return (ahead + 1) * self.service_time / self.max_concurrency
+
+    @asynccontextmanager
+    async def slot(self, endpoint, budget=None, flow="anonymous", plan="free"):
+        """Hold one upstream slot for the duration of the block"""
+        budget = self.budget_for(endpoint) if budget is None else budget
+        waited = await self._acquire(endpoint, budget, flow, PLAN_WEIGHTS.get(plan, 1.0))
+        metrics.observe("admission.wait_ms", waited * 1000)
+        metrics.observe(f"admission.wait_ms.{endpoint}", waited * 1000)
+        metrics.observe(f"admission.wait_ms.plan.{plan}", waited * 1000)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.service_time += 0.2 * ((time.monotonic() - started) - self.service_time)
+            self._release()
+
+    async def _acquire(self, endpoint, budget, flow, weight):
+        if self.active < self.max_concurrency and not self._queue:
+            self.active += 1
+            return 0.0
+
+        expected = self.estimated_wait(self._queue.position(flow, weight))
+        if len(self._queue) >= self.max_queue or expected > budget:
+            metrics.incr(f"admission.rejected.{endpoint}")
+            raise Overloaded("Service is busy, please retry shortly", retry_after=expected)
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = self._queue.push(flow, weight, waiter)
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, timeout=budget)
+        except asyncio.TimeoutError:
+            self._queue.remove(entry)
+            metrics.incr(f"admission.timed_out.{endpoint}")
+            raise Overloaded("Timed out waiting for capacity, please retry shortly", retry_after=self.estimated_wait())
+        except asyncio.CancelledError:
+            self._queue.remove(entry)
+            # The slot may have been handed over just before the cancellation
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        return time.monotonic() - queued_at
+
+    def _release(self):
+        # Hand the slot straight to the next waiter in fair order, else free it
+        while True:
+            entry = self._queue.pop()
+            if entry is None:
+                break
+            if not entry.item.done():
+                entry.item.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "max_concurrency": self.max_concurrency,
+            "service_time_ms": round(self.service_time * 1000, 1),
+        }
+
+
+upstream_admission = AdmissionController()
+metrics.register_gauge("admission.upstream", upstream_admission.stats)
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Run an async callable every ``interval`` seconds on the event loop.
+
+    Failures are logged and counted; they never stop the schedule.
+    """
+
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name=self.name)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.func()
+                metrics.incr(f"task.{self.name}.runs")
+            except Exception:
+                metrics.incr(f"task.{self.name}.failures")
+                logger.exception("Periodic task %s failed", self.name)
@@ -0,0 +1,77 @@
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from app.core.config import settings
+
+MAX_REQUEST_BODY_BYTES = settings.max_request_body_bytes
+MAX_UPLOAD_BYTES = settings.max_upload_bytes
+# Endpoints taking file uploads get the larger limit
+UPLOAD_PATHS = {"/api/tools/bulk-generate", "/api/tools/summarize-document"}
+
+
+class BodyTooLarge(HTTPException):
+    """413 raised when a request body is over the size limit"""
+
+    def __init__(self, limit):
+        super().__init__(status_code=413, detail=f"Request body larger than {limit} bytes")
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies over the limit before they are buffered.
+
+    A declared Content-Length over the limit is answered with 413 straight
+    away. Bodies without one (chunked uploads) are counted as they are read,
+    and reading past the limit raises BodyTooLarge. The limit is ``max_bytes``,
+    or ``upload_bytes`` for the paths in ``upload_paths``.
+    """
+
+    def __init__(self, app, max_bytes=MAX_REQUEST_BODY_BYTES, prefix="/api/",
+                 upload_bytes=MAX_UPLOAD_BYTES, upload_paths=UPLOAD_PATHS):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.upload_bytes = upload_bytes
+        self.upload_paths = upload_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        limit = self.upload_bytes if scope["path"].rstrip("/") in self.upload_paths else self.max_bytes
+
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                if value.isdigit() and int(value) > limit:
+                    await self._reject(scope, receive, send, limit)
+                    return
+                break
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise BodyTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except BodyTooLarge:
+            # Raised outside the routes (e.g. while a middleware buffers the body)
+            if response_started:
+                raise
+            await self._reject(scope, receive, send, limit)
+
+    async def _reject(self, scope, receive, send, limit):
+        exc = BodyTooLarge(limit)
+        await JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})(scope, receive, send)
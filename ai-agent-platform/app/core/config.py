@@ -0,0 +1,159 @@
+"""Application settings.
+
+Everything configurable comes from the environment (plus a ``.env`` file,
+loaded once) and is read into one immutable ``Settings`` object on first use.
+Modules take their values from ``settings`` instead of calling ``os.getenv``.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional
+from dotenv import load_dotenv
+
+
+def _env(name, default=None, cast=str):
+    """Dataclass field read from environment variable ``name``; unset or empty means ``default``"""
+    def factory():
+        value = os.getenv(name)
+        if value is None or value == "":
+            return default
+        return cast(value)
+    return field(default_factory=factory)
+
+
+def _flag(value):
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    # Server (python -m app.serve)
+    host: str = _env("HOST", "0.0.0.0")
+    port: int = _env("PORT", 8000, int)
+    web_concurrency: int = _env("WEB_CONCURRENCY", os.cpu_count() or 1, int)
+    server_loop: str = _env("SERVER_LOOP", "auto")  # auto | asyncio | uvloop
+    server_http: str = _env("SERVER_HTTP", "auto")  # auto | h11 | httptools
+    server_backlog: int = _env("SERVER_BACKLOG", 2048, int)
+    graceful_timeout: int = _env("GRACEFUL_TIMEOUT", 30, int)
+    log_level: str = _env("LOG_LEVEL", "info")
+
+    # Database
+    database_url: str = _env("DATABASE_URL", "sqlite:///./ai_platform.db")
+    db_pool_size: int = _env("DB_POOL_SIZE", 10, int)
+    db_max_overflow: int = _env("DB_MAX_OVERFLOW", 20, int)
+    db_pool_recycle: int = _env("DB_POOL_RECYCLE", 1800, int)
+    db_pool_timeout: int = _env("DB_POOL_TIMEOUT", 30, int)
+    sqlite_busy_timeout_ms: int = _env("SQLITE_BUSY_TIMEOUT_MS", 5000, int)
+    sqlite_mmap_size: int = _env("SQLITE_MMAP_SIZE", 256 * 1024 * 1024, int)
+
+    # Auth
+    secret_key: Optional[str] = _env("SECRET_KEY")
+    algorithm: str = _env("ALGORITHM", "HS256")
+    access_token_expire_minutes: int = _env("ACCESS_TOKEN_EXPIRE_MINUTES", 30, int)
+
+    # Third-party APIs
+    openai_api_key: Optional[str] = _env("OPENAI_API_KEY")
+    stripe_secret_key: Optional[str] = _env("STRIPE_SECRET_KEY")
+    stripe_webhook_secret: Optional[str] = _env("STRIPE_WEBHOOK_SECRET")
+    stripe_basic_price_id: str = _env("STRIPE_BASIC_PRICE_ID", "price_basic_placeholder")
+    stripe_premium_price_id: str = _env("STRIPE_PREMIUM_PRICE_ID", "price_premium_placeholder")
+    frontend_url: str = _env("FRONTEND_URL", "http://localhost:8501")
+
+    # Stripe webhook inbox consumer
+    stripe_event_batch_size: int = _env("STRIPE_EVENT_BATCH_SIZE", 100, int)
+    stripe_event_poll_interval: float = _env("STRIPE_EVENT_POLL_INTERVAL", 5.0, float)
+    stripe_event_max_attempts: int = _env("STRIPE_EVENT_MAX_ATTEMPTS", 10, int)
+
+    # Caches and periodic jobs
+    entitlement_cache_ttl: int = _env("ENTITLEMENT_CACHE_TTL", 60, int)
+    entitlement_cache_size: int = _env("ENTITLEMENT_CACHE_SIZE", 100000, int)
+    subscription_sweep_interval: int = _env("SUBSCRIPTION_SWEEP_INTERVAL", 300, int)
+    account_cache_ttl: int = _env("ACCOUNT_CACHE_TTL", 10, int)
+    account_cache_size: int = _env("ACCOUNT_CACHE_SIZE", 10000, int)
+
+    # Write-behind ledgers
+    content_flush_interval: float = _env("CONTENT_FLUSH_INTERVAL", 1.0, float)
+    content_flush_batch: int = _env("CONTENT_FLUSH_BATCH", 200, int)
+    content_output_text_max: int = _env("CONTENT_OUTPUT_TEXT_MAX", 20000, int)
+    usage_flush_interval: float = _env("USAGE_FLUSH_INTERVAL", 2.0, float)
+    usage_flush_batch: int = _env("USAGE_FLUSH_BATCH", 500, int)
+    usage_rollup_interval: int = _env("USAGE_ROLLUP_INTERVAL", 60, int)
+    usage_rollup_grace_minutes: int = _env("USAGE_ROLLUP_GRACE_MINUTES", 60, int)
+
+    # Executors and event loop monitoring
+    blocking_io_workers: int = _env("BLOCKING_IO_WORKERS", min(32, (os.cpu_count() or 1) + 4), int)
+    render_process_workers: int = _env("RENDER_PROCESS_WORKERS", 0, int)
+    loop_lag_threshold_ms: float = _env("LOOP_LAG_THRESHOLD_MS", 100.0, float)
+    loop_lag_interval_ms: float = _env("LOOP_LAG_INTERVAL_MS", 50.0, float)
+
+    # Upstream admission control, rate limiting and deadlines (JSON values override the defaults per key)
+    upstream_max_concurrency: int = _env("UPSTREAM_MAX_CONCURRENCY", 16, int)
+    upstream_max_queue: int = _env("UPSTREAM_MAX_QUEUE", 256, int)
+    admission_budgets: dict = _env("ADMISSION_BUDGETS", {}, json.loads)
+    plan_weights: dict = _env("PLAN_WEIGHTS", {}, json.loads)
+    scheduler_starvation_after: float = _env("SCHEDULER_STARVATION_AFTER", 5.0, float)
+    rate_limits: dict = _env("RATE_LIMITS", {}, json.loads)
+    rate_limit_max_keys: int = _env("RATE_LIMIT_MAX_KEYS", 100000, int)
+    request_deadlines: dict = _env("REQUEST_DEADLINES", {}, json.loads)
+
+    # Request bodies
+    max_request_body_bytes: int = _env("MAX_REQUEST_BODY_BYTES", 256 * 1024, int)
+    max_prompt_chars: int = _env("MAX_PROMPT_CHARS", 32000, int)
+    max_speech_chars: int = _env("MAX_SPEECH_CHARS", 4096, int)
+    max_upload_bytes: int = _env("MAX_UPLOAD_BYTES", 10 * 1024 * 1024, int)  # file uploads
+    gzip_minimum_size: int = _env("GZIP_MINIMUM_SIZE", 1024, int)
+
+    # Idempotency-Key replay store for the AI tools
+    idempotency_ttl: int = _env("IDEMPOTENCY_TTL", 600, int)
+    idempotency_max_keys: int = _env("IDEMPOTENCY_MAX_KEYS", 10000, int)
+    idempotency_wait: float = _env("IDEMPOTENCY_WAIT", 30.0, float)
+
+    # Upstream retries, circuit breakers and hedged requests
+    upstream_retry_attempts: int = _env("UPSTREAM_RETRY_ATTEMPTS", 3, int)
+    upstream_retry_max_wait: float = _env("UPSTREAM_RETRY_MAX_WAIT", 8.0, float)
+    breaker_failure_threshold: int = _env("BREAKER_FAILURE_THRESHOLD", 5, int)
+    breaker_recovery_seconds: float = _env("BREAKER_RECOVERY_SECONDS", 30.0, float)
+    hedge_operations: str = _env("HEDGE_OPERATIONS", "")  # comma-separated, e.g. "generate_text,generate_code"
+    hedge_min_delay: float = _env("HEDGE_MIN_DELAY", 0.5, float)
+    hedge_min_samples: int = _env("HEDGE_MIN_SAMPLES", 20, int)
+
+    # Token budgets for completions
+    max_output_tokens: int = _env("MAX_OUTPUT_TOKENS", 4096, int)
+    max_input_tokens: int = _env("MAX_INPUT_TOKENS", 4000, int)
+
+    # Model routing (JSON values override the defaults per key)
+    model_routes: dict = _env("MODEL_ROUTES", {}, json.loads)
+    model_costs: dict = _env("MODEL_COSTS", {}, json.loads)
+    model_max_error_rate: float = _env("MODEL_MAX_ERROR_RATE", 0.5, float)
+    model_health_window: float = _env("MODEL_HEALTH_WINDOW", 120.0, float)
+
+    # Near-duplicate prompt cache (thresholds as JSON, per endpoint)
+    prompt_cache_enabled: bool = _env("PROMPT_CACHE_ENABLED", False, _flag)
+    prompt_cache_size: int = _env("PROMPT_CACHE_SIZE", 5000, int)
+    prompt_cache_ttl: int = _env("PROMPT_CACHE_TTL", 3600, int)
+    prompt_cache_thresholds: dict = _env("PROMPT_CACHE_THRESHOLDS", {}, json.loads)
+
+    # Code-assistant sessions
+    code_session_context_tokens: int = _env("CODE_SESSION_CONTEXT_TOKENS", 3000, int)
+    code_session_ttl: int = _env("CODE_SESSION_TTL", 24 * 3600, int)
+    code_session_purge_interval: int = _env("CODE_SESSION_PURGE_INTERVAL", 3600, int)
+
+    # Bulk generation from an uploaded CSV/JSONL of prompts
+    bulk_concurrency: int = _env("BULK_CONCURRENCY", 4, int)
+    bulk_max_rows: int = _env("BULK_MAX_ROWS", 1000, int)
+
+    # Summaries of uploaded documents (map over chunks, then reduce)
+    summary_chunk_tokens: int = _env("SUMMARY_CHUNK_TOKENS", 3000, int)
+    summary_part_tokens: int = _env("SUMMARY_PART_TOKENS", 400, int)
+    summary_concurrency: int = _env("SUMMARY_CONCURRENCY", 8, int)
+    summary_max_chunks: int = _env("SUMMARY_MAX_CHUNKS", 64, int)
+
+
+@lru_cache()
+def get_settings() -> Settings:
+    load_dotenv()
+    return Settings()
+
+
+settings = get_settings()
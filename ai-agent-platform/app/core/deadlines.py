@@ -0,0 +1,152 @@
+import asyncio
+import time
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from app.core.body_limit import UPLOAD_PATHS
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# End-to-end time allowed for each tool endpoint, in seconds
+DEFAULT_DEADLINES = {
+    "generate-image": 60.0,
+    "generate-code": 45.0,
+    "generate-document": 60.0,
+    "generate-presentation": 90.0,
+    "text-to-speech": 45.0,
+    "summarize-document": 180.0,
+}
+DEFAULT_DEADLINE = 60.0
+REQUEST_DEADLINES = {**DEFAULT_DEADLINES, **settings.request_deadlines}
+
+# Clients may ask for a shorter (never a longer) deadline, in seconds
+DEADLINE_HEADER = b"x-request-timeout"
+
+
+class DeadlineExceeded(HTTPException):
+    """504 raised when a request runs out of time before its response starts"""
+
+    def __init__(self, stage="request"):
+        super().__init__(status_code=504, detail=f"Request deadline exceeded during {stage}")
+
+
+def deadline_for(scope, endpoint):
+    budget = float(REQUEST_DEADLINES.get(endpoint, DEFAULT_DEADLINE))
+    for name, value in scope.get("headers", ()):
+        if name == DEADLINE_HEADER:
+            try:
+                budget = min(budget, max(0.0, float(value)))
+            except ValueError:
+                pass
+            break
+    return time.monotonic() + budget
+
+
+class RequestDeadlineMiddleware:
+    """Cancel tool requests whose client went away or whose deadline passed.
+
+    The handler runs as a task next to a watcher on ``receive()``. A client
+    disconnect cancels the handler; so does the deadline (stored on
+    ``request.state.deadline`` for the code below to budget against), which
+    then answers 504. Cancellation unwinds through admission slots, upstream
+    calls and render stages, so none of the later stages start. Once the
+    response has started only a disconnect can cancel it, which keeps long
+    downloads alive.
+
+    The request body is read up front so the watcher owns ``receive()``.
+    Uploads (``upload_paths``) are not buffered: the handler reads them as
+    they arrive, and the watcher starts once the last chunk is in.
+    """
+
+    def __init__(self, app, prefix="/api/tools/", upload_paths=UPLOAD_PATHS):
+        self.app = app
+        self.prefix = prefix
+        self.upload_paths = upload_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = scope["path"].rstrip("/").rsplit("/", 1)[-1]
+        deadline = deadline_for(scope, endpoint)
+        scope.setdefault("state", {})["deadline"] = deadline
+
+        streamed = scope["path"].rstrip("/") in self.upload_paths
+        body = []
+        while not streamed:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                metrics.incr(f"requests.cancelled.disconnect.{endpoint}")
+                return
+            body.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+
+        disconnected = asyncio.Event()
+        # Set once the handler is done with receive(), which then belongs to the watcher
+        body_read = asyncio.Event()
+        if not streamed:
+            body_read.set()
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if streamed and not body_sent:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                if message["type"] == "http.disconnect" or not message.get("more_body"):
+                    body_sent = True
+                    body_read.set()
+                return message
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": b"".join(body), "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        response_started = False
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        async def watch_disconnect():
+            await body_read.wait()
+            while not disconnected.is_set() and (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        started = time.monotonic()
+        handler = asyncio.ensure_future(self.app(scope, replay_receive, tracking_send))
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            timeout = max(0.0, deadline - time.monotonic())
+            await asyncio.wait({handler, watcher}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not handler.done() and not watcher.done() and response_started:
+                # Streaming already: only the client leaving stops it now
+                await asyncio.wait({handler, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if handler.done():
+                handler.result()
+                return
+
+            handler.cancel()
+            try:
+                await handler
+            except asyncio.CancelledError:
+                pass
+            metrics.observe("requests.cancelled_after_ms", (time.monotonic() - started) * 1000)
+            if watcher.done():
+                metrics.incr(f"requests.cancelled.disconnect.{endpoint}")
+                return
+            metrics.incr(f"requests.cancelled.deadline.{endpoint}")
+            if not response_started:
+                exc = DeadlineExceeded()
+                await JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})(scope, receive, send)
+        finally:
+            watcher.cancel()
+            if not handler.done():
+                handler.cancel()
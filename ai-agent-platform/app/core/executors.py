@@ -0,0 +1,87 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.core.metrics import metrics
+from app.core.config import settings
+
+
+# Threads for blocking file I/O and synchronous SDK calls
+IO_WORKERS = settings.blocking_io_workers
+# Processes for CPU-heavy rendering (docx/pptx); 0 keeps rendering on the I/O threads
+RENDER_PROCESS_WORKERS = settings.render_process_workers
+
+_lock = threading.Lock()
+_DONE = object()
+_io_executor = None
+_render_executor = None
+
+
+def get_io_executor():
+    global _io_executor
+    if _io_executor is None:
+        with _lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="blocking-io")
+    return _io_executor
+
+
+def get_render_executor():
+    """Return the executor used for CPU-bound rendering work"""
+    global _render_executor
+    if RENDER_PROCESS_WORKERS <= 0:
+        return get_io_executor()
+    if _render_executor is None:
+        with _lock:
+            if _render_executor is None:
+                # spawn rather than fork: the parent already runs the event loop and thread pools
+                _render_executor = ProcessPoolExecutor(
+                    max_workers=RENDER_PROCESS_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _render_executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the shared I/O thread pool without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    metrics.incr("executor.io.submitted")
+    return await loop.run_in_executor(get_io_executor(), call)
+
+
+async def run_render(func, *args, **kwargs):
+    """Run CPU-heavy rendering off the event loop.
+
+    With RENDER_PROCESS_WORKERS > 0 the call goes to a process pool, so ``func``
+    and its arguments must be picklable (module-level functions, plain data).
+    """
+    if RENDER_PROCESS_WORKERS <= 0:
+        return await run_blocking(func, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    metrics.incr("executor.render.submitted")
+    return await loop.run_in_executor(get_render_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def iterate_blocking(iterator):
+    """Iterate a blocking iterator (e.g. a generator reading files) on the I/O thread pool"""
+    while True:
+        item = await run_blocking(next, iterator, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+
+def shutdown_executors(wait=True):
+    global _io_executor, _render_executor
+    with _lock:
+        executors = [_io_executor, _render_executor]
+        _io_executor = None
+        _render_executor = None
+    for executor in executors:
+        if executor is not None:
+            executor.shutdown(wait=wait)
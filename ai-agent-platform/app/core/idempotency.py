@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import time
+from cachetools import TTLCache
+from starlette.responses import JSONResponse
+
+from app.core.body_limit import UPLOAD_PATHS
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.rate_limit import identify
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+IDEMPOTENCY_TTL = settings.idempotency_ttl
+IDEMPOTENCY_MAX_KEYS = settings.idempotency_max_keys
+# How long a retry waits for the original request before answering 409
+IDEMPOTENCY_WAIT = settings.idempotency_wait
+MAX_KEY_LENGTH = 255
+# Larger responses are not kept for replay
+MAX_STORED_BODY = 1024 * 1024
+# Worth retrying for real rather than replaying
+TRANSIENT_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "status", "headers", "body")
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint  # None until an upload body has streamed past
+        self.done = asyncio.Event()
+        self.status = None  # None while in flight, or if the request gave nothing to replay
+        self.headers = None
+        self.body = None
+
+
+class IdempotencyMiddleware:
+    """Run each ``Idempotency-Key`` at most once per caller and replay the result.
+
+    The first request with a key runs normally, and its response is stored
+    for ``IDEMPOTENCY_TTL`` seconds. A retry with the same key and the same
+    body gets that response back (marked ``Idempotent-Replayed: true``)
+    without reaching the rate limiter or the upstream APIs. A retry that
+    arrives while the original is still running waits for it (up to
+    ``IDEMPOTENCY_WAIT`` seconds, else 409 with Retry-After). Reusing a key
+    for a different body is a 422.
+
+    Transient failures (429, 5xx, deadlines) and requests that ended
+    without a response (client gone) are not stored, so a retry runs
+    again. Keys are scoped to the caller and the endpoint, and kept in
+    process memory: each server worker has its own store.
+
+    Uploads (``upload_paths``) are hashed as they stream through to the
+    handler, never buffered. A retry of an upload is read (and hashed) to
+    compare it with the original; if the original left nothing to replay,
+    the retry gets a 409 and has to be sent again.
+    """
+
+    def __init__(self, app, prefix="/api/tools/", upload_paths=UPLOAD_PATHS):
+        self.app = app
+        self.prefix = prefix
+        self.upload_paths = upload_paths
+        self._entries = TTLCache(maxsize=IDEMPOTENCY_MAX_KEYS, ttl=IDEMPOTENCY_TTL)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+        key = next((value for name, value in scope.get("headers", ()) if name == IDEMPOTENCY_HEADER), None)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await self._error(scope, receive, send, 400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+            return
+
+        streamed = scope["path"].rstrip("/") in self.upload_paths
+        body, fingerprint, consumed = None, None, False
+        if not streamed:
+            body = await self._read_body(receive)
+            if body is None:
+                return
+            fingerprint = hashlib.sha256(body).digest()
+        caller, _ = identify(scope)
+        store_key = (caller, scope["path"], key)
+
+        waited_until = time.monotonic() + IDEMPOTENCY_WAIT
+        while True:
+            entry = self._entries.get(store_key)
+            if entry is None:
+                break
+            if fingerprint is None:
+                fingerprint = await self._digest(receive)
+                if fingerprint is None:
+                    return
+                consumed = True
+            if entry.fingerprint is not None and entry.fingerprint != fingerprint:
+                metrics.incr("idempotency.mismatch")
+                await self._error(scope, receive, send, 422, "Idempotency-Key was already used for a different request")
+                return
+            if entry.status is not None:
+                metrics.incr("idempotency.replayed")
+                await send({"type": "http.response.start", "status": entry.status,
+                            "headers": entry.headers + [(b"idempotent-replayed", b"true")]})
+                await send({"type": "http.response.body", "body": entry.body})
+                return
+            if entry.done.is_set():
+                # The original gave up without a result; this one takes over
+                self._entries.pop(store_key, None)
+                break
+            try:
+                await asyncio.wait_for(entry.done.wait(), timeout=max(0.0, waited_until - time.monotonic()))
+            except asyncio.TimeoutError:
+                metrics.incr("idempotency.in_progress")
+                await self._error(scope, receive, send, 409, "A request with this Idempotency-Key is still in progress",
+                                  headers={"Retry-After": "1"})
+                return
+        if consumed:
+            # This upload was read for its fingerprint and cannot be replayed to the handler
+            await self._error(scope, receive, send, 409, "The original request with this Idempotency-Key "
+                              "ended without a result; send it again", headers={"Retry-After": "1"})
+            return
+
+        entry = self._entries[store_key] = _Entry(fingerprint)
+        metrics.incr("idempotency.executed")
+        body_sent = False
+        digest = hashlib.sha256()
+
+        async def replay_receive():
+            nonlocal body_sent
+            if streamed:
+                message = await receive()
+                if message["type"] == "http.request" and entry.fingerprint is None:
+                    digest.update(message.get("body", b""))
+                    if not message.get("more_body"):
+                        entry.fingerprint = digest.digest()
+                return message
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status, headers, chunks, size = None, None, [], 0
+
+        async def capturing_send(message):
+            nonlocal status, headers, size
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", []))
+            elif message["type"] == "http.response.body" and size <= MAX_STORED_BODY:
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capturing_send)
+        finally:
+            if (status is not None and status not in TRANSIENT_STATUSES and size <= MAX_STORED_BODY
+                    and entry.fingerprint is not None):
+                entry.status, entry.headers, entry.body = status, headers, b"".join(chunks)
+            else:
+                self._entries.pop(store_key, None)
+            entry.done.set()
+
+    @staticmethod
+    async def _read_body(receive):
+        """The whole request body, or None if the client went away"""
+        body = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            body.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(body)
+
+    @staticmethod
+    async def _digest(receive):
+        """sha256 of the request body, read without keeping it, or None if the client went away"""
+        digest = hashlib.sha256()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            digest.update(message.get("body", b""))
+            if not message.get("more_body"):
+                return digest.digest()
+
+    async def _error(self, scope, receive, send, status_code, detail, headers=None):
+        await JSONResponse(status_code=status_code, content={"detail": detail}, headers=headers)(scope, receive, send)
@@ -0,0 +1,35 @@
+import importlib
+import threading
+
+from app.core.executors import run_blocking
+
+
+class LazyModule:
+    """A heavy third-party module imported on first use instead of at startup.
+
+    ``get()`` imports (and ``configure``s) the module and is meant for code
+    already running on a worker thread. On the event loop use
+    ``await load()``, which does the first import on the I/O threads: SDKs
+    like stripe take the best part of a second to import.
+    """
+
+    def __init__(self, name, configure=None):
+        self.name = name
+        self.configure = configure
+        self._module = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self.name)
+                    if self.configure is not None:
+                        self.configure(module)
+                    self._module = module
+        return self._module
+
+    async def load(self):
+        if self._module is not None:
+            return self._module
+        return await run_blocking(self.get)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from app.core.metrics import metrics
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_THRESHOLD_MS = settings.loop_lag_threshold_ms
+LOOP_LAG_INTERVAL_MS = settings.loop_lag_interval_ms
+
+
+class LoopLagMonitor:
+    """Watchdog that reports when the event loop is blocked.
+
+    A heartbeat task on the loop records when it last ran. A separate thread
+    checks the heartbeat and, if it is older than the threshold, logs the stack
+    of the loop thread, i.e. the code that is holding the loop.
+    """
+
+    def __init__(self, threshold_ms=LOOP_LAG_THRESHOLD_MS, interval_ms=LOOP_LAG_INTERVAL_MS):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.stalls = 0
+        self.max_lag_ms = 0.0
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag_ms = max(0.0, (now - expected) * 1000)
+            self._last_beat = now
+            metrics.observe("loop.lag_ms", lag_ms)
+            if lag_ms > self.max_lag_ms:
+                self.max_lag_ms = lag_ms
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stop.wait(self.interval / 2):
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat - self.interval
+            if blocked_for < self.threshold or reported_beat == last_beat:
+                continue
+            # Report each stall once, while it is still happening
+            reported_beat = last_beat
+            self.stalls += 1
+            metrics.incr("loop.stalls")
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<unavailable>"
+            logger.warning(
+                "Event loop blocked for more than %.0f ms. Loop thread stack:\n%s",
+                blocked_for * 1000,
+                stack,
+            )
+
+    def stats(self):
+        return {"stalls": self.stalls, "max_lag_ms": round(self.max_lag_ms, 2), "threshold_ms": self.threshold * 1000}
+
+
+loop_monitor = LoopLagMonitor()
+metrics.register_gauge("loop.monitor", loop_monitor.stats)
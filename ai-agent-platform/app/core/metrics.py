@@ -0,0 +1,56 @@
+import threading
+
+
+class Metrics:
+    """Minimal in-process metrics registry (counters, observations and gauges).
+
+    Everything lives in process memory, so each worker reports its own numbers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._observations = {}
+        self._gauges = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """Record a sample; keeps count, sum and max per metric."""
+        with self._lock:
+            stats = self._observations.get(name)
+            if stats is None:
+                self._observations[name] = [1, value, value]
+            else:
+                stats[0] += 1
+                stats[1] += value
+                if value > stats[2]:
+                    stats[2] = value
+
+    def register_gauge(self, name, func):
+        """Register a callable that is sampled whenever a snapshot is taken."""
+        with self._lock:
+            self._gauges[name] = func
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            observations = {
+                name: {"count": count, "sum": total, "avg": total / count, "max": peak}
+                for name, (count, total, peak) in self._observations.items()
+            }
+            gauges = dict(self._gauges)
+
+        sampled = {}
+        for name, func in gauges.items():
+            try:
+                sampled[name] = func()
+            except Exception as e:
+                sampled[name] = f"error: {e}"
+
+        return {"counters": counters, "observations": observations, "gauges": sampled}
+
+
+metrics = Metrics()
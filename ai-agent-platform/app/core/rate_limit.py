@@ -0,0 +1,173 @@
+import asyncio
+import math
+import time
+from starlette.responses import JSONResponse
+
+from app.core.metrics import metrics
+from app.core.security import decode_access_token
+from app.services.entitlement_service import DEFAULT_PLAN, EntitlementService
+from app.core.config import settings
+
+
+# Cost class of each tool endpoint; anything else under /api/tools counts as text
+COST_CLASSES = {
+    "/api/tools/generate-image": "image",
+    "/api/tools/text-to-speech": "tts",
+    "/api/tools/generate-presentation": "presentation",
+    "/api/tools/generate-code": "text",
+    "/api/tools/generate-document": "text",
+}
+DEFAULT_COST_CLASS = "text"
+
+# (burst capacity, requests refilled per minute) per plan and cost class
+DEFAULT_PLAN_LIMITS = {
+    "free": {"text": (10, 10), "image": (3, 2), "tts": (5, 5), "presentation": (2, 1)},
+    "basic": {"text": (30, 30), "image": (10, 6), "tts": (20, 15), "presentation": (5, 3)},
+    "premium": {"text": (60, 120), "image": (20, 20), "tts": (40, 60), "presentation": (10, 10)},
+}
+
+# Same shape as DEFAULT_PLAN_LIMITS, as JSON; merged over the defaults
+PLAN_LIMITS = {plan: dict(classes) for plan, classes in DEFAULT_PLAN_LIMITS.items()}
+for _plan, _classes in settings.rate_limits.items():
+    PLAN_LIMITS.setdefault(_plan, {}).update({name: tuple(limit) for name, limit in _classes.items()})
+
+RATE_LIMIT_MAX_KEYS = settings.rate_limit_max_keys
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity, per_minute, now):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now, cost=1.0):
+        """Spend ``cost`` tokens; returns 0 on success, else seconds until it would succeed"""
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """Token buckets keyed by (caller, plan, cost class), all in process memory"""
+
+    def __init__(self, plan_limits=PLAN_LIMITS, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.plan_limits = plan_limits
+        self.max_keys = max_keys
+        self._buckets = {}
+
+    def limit_for(self, plan, cost_class):
+        limits = self.plan_limits.get(plan) or self.plan_limits[DEFAULT_PLAN]
+        return limits.get(cost_class) or limits[DEFAULT_COST_CLASS]
+
+    def check(self, caller, plan, cost_class):
+        """Returns (retry_after_seconds, bucket); retry_after is 0 when allowed"""
+        now = time.monotonic()
+        key = (caller, plan, cost_class)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            capacity, per_minute = self.limit_for(plan, cost_class)
+            bucket = self._buckets[key] = TokenBucket(capacity, per_minute, now)
+        return bucket.take(now), bucket
+
+    def _prune(self, now):
+        # A full bucket is indistinguishable from a new one, so dropping it loses nothing
+        for key in [key for key, bucket in self._buckets.items() if bucket.is_full(now)]:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def identify(scope):
+    """Returns (caller key, user id or None) from the bearer token, else the client address"""
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                payload = decode_access_token(token)
+                if payload is not None:
+                    user_id = payload.get("uid")
+                    return f"user:{user_id if user_id is not None else payload.get('sub')}", user_id
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}", None
+
+
+class RateLimitMiddleware:
+    """Plan-aware rate limiting for the AI tool endpoints.
+
+    A pure ASGI middleware: the hot path is a cached token decode, a cached
+    plan lookup and a dict access. The resolved caller and plan are left on
+    ``request.state`` for downstream handlers.
+    """
+
+    def __init__(self, app, limiter=None, prefix="/api/tools/"):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        caller, user_id = identify(scope)
+        plan = await EntitlementService.get_plan(user_id) if user_id is not None else DEFAULT_PLAN
+        cost_class = COST_CLASSES.get(scope["path"].rstrip("/"), DEFAULT_COST_CLASS)
+
+        state = scope.setdefault("state", {})
+        state["caller"] = caller
+        state["user_id"] = user_id
+        state["plan"] = plan
+
+        retry_after, bucket = self.limiter.check(caller, plan, cost_class)
+        if retry_after:
+            metrics.incr(f"ratelimit.rejected.{cost_class}")
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": f"Rate limit exceeded for {cost_class} requests on the {plan} plan"},
+                headers={
+                    "Retry-After": str(math.ceil(retry_after)),
+                    "X-RateLimit-Limit": str(bucket.capacity),
+                    "X-RateLimit-Remaining": "0",
+                },
+            )
+            await response(scope, receive, send)
+            return
+
+        metrics.incr(f"ratelimit.allowed.{cost_class}")
+        await self.app(scope, receive, send)
+
+
+rate_limiter = RateLimiter()
+metrics.register_gauge("ratelimit.buckets", lambda: len(rate_limiter))
+
+
+async def pace(ctx, endpoint):
+    """Wait until the caller's rate limit allows one more ``endpoint`` call.
+
+    For requests that make many upstream calls (bulk rows, summary parts):
+    each call counts against the plan's limits like a single request would,
+    and the work slows down to the plan's rate instead of failing.
+    """
+    cost_class = COST_CLASSES.get(f"/api/tools/{endpoint}", DEFAULT_COST_CLASS)
+    while True:
+        retry_after, _ = rate_limiter.check(ctx.caller, ctx.plan, cost_class)
+        if not retry_after:
+            return
+        metrics.observe(f"rate_limit.paced_ms.{endpoint}", retry_after * 1000)
+        await asyncio.sleep(retry_after)
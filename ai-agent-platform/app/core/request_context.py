@@ -0,0 +1,63 @@
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import Request
+
+from app.core.deadlines import DeadlineExceeded
+from app.services.entitlement_service import DEFAULT_PLAN
+
+
+@dataclass
+class RequestContext:
+    """Who is calling which tool endpoint; read by services below the route layer"""
+    endpoint: str
+    caller: str = "anonymous"
+    user_id: Optional[int] = None
+    plan: str = DEFAULT_PLAN
+    deadline: Optional[float] = None  # time.monotonic() value, set by RequestDeadlineMiddleware
+    output_dir: Optional[str] = None  # where generated files go; the system temp directory if None
+
+
+_current = ContextVar("request_context", default=None)
+
+
+def get_request_context() -> Optional[RequestContext]:
+    return _current.get()
+
+
+def set_request_context(ctx: RequestContext):
+    _current.set(ctx)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None without one"""
+    ctx = _current.get()
+    if ctx is None or ctx.deadline is None:
+        return None
+    return ctx.deadline - time.monotonic()
+
+
+def check_deadline(stage: str):
+    """Raise DeadlineExceeded instead of starting ``stage`` once the request is out of time"""
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(stage)
+
+
+async def tool_request_context(request: Request) -> RequestContext:
+    """Router dependency: publish the request context for the rest of the request.
+
+    Must stay ``async def``: sync dependencies run in a worker thread and
+    their context variable changes would not reach the endpoint.
+    """
+    state = request.state
+    ctx = RequestContext(
+        endpoint=request.url.path.rstrip("/").rsplit("/", 1)[-1],
+        caller=getattr(state, "caller", "anonymous"),
+        user_id=getattr(state, "user_id", None),
+        plan=getattr(state, "plan", DEFAULT_PLAN),
+        deadline=getattr(state, "deadline", None),
+    )
+    set_request_context(ctx)
+    return ctx
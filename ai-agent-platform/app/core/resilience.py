@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from fastapi import HTTPException
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from app.core.config import settings
+from app.core.executors import run_blocking
+from app.core.metrics import metrics
+from app.core.request_context import check_deadline, remaining_time
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_RETRY_ATTEMPTS = settings.upstream_retry_attempts
+UPSTREAM_RETRY_MAX_WAIT = settings.upstream_retry_max_wait
+BREAKER_FAILURE_THRESHOLD = settings.breaker_failure_threshold
+BREAKER_RECOVERY_SECONDS = settings.breaker_recovery_seconds
+# Operations that may send a duplicate request when the first is slower than its p95
+HEDGE_OPERATIONS = {name.strip() for name in settings.hedge_operations.split(",") if name.strip()}
+HEDGE_MIN_DELAY = settings.hedge_min_delay
+HEDGE_MIN_SAMPLES = settings.hedge_min_samples
+
+# SDK exception types worth retrying, by class name (covers the 0.x and 1.x openai SDKs)
+RETRYABLE_ERRORS = {
+    "APIConnectionError", "APIError", "APITimeoutError", "InternalServerError",
+    "RateLimitError", "ServiceUnavailableError", "Timeout", "TryAgain",
+}
+# SDK exception types meaning the request itself was refused
+CLIENT_ERRORS = {"BadRequestError", "InvalidRequestError", "UnprocessableEntityError"}
+CLIENT_ERROR_STATUSES = {400, 404, 409, 413, 422}
+# Our API key was rejected: an upstream failure, whatever the user sent
+AUTH_ERRORS = {"AuthenticationError", "PermissionDeniedError", "PermissionError"}
+AUTH_ERROR_STATUSES = {401, 403}
+
+
+class UpstreamError(HTTPException):
+    """An upstream call failed for good (after any retries)"""
+
+    def __init__(self, operation, detail, status_code=502, headers=None):
+        super().__init__(status_code=status_code, detail=f"{operation} failed: {detail}", headers=headers)
+
+
+class UpstreamUnavailable(UpstreamError):
+    """503 while an operation's circuit breaker is open"""
+
+    def __init__(self, operation, retry_after):
+        super().__init__(
+            operation,
+            "upstream is failing, please retry shortly",
+            status_code=503,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+def _status_of(exc):
+    status = getattr(exc, "http_status", None) or getattr(exc, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc):
+    status = _status_of(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(exc).__name__ in RETRYABLE_ERRORS or isinstance(exc, (ConnectionError, TimeoutError))
+
+
+def is_client_error(exc):
+    status = _status_of(exc)
+    if status is not None:
+        return status in CLIENT_ERROR_STATUSES
+    return type(exc).__name__ in CLIENT_ERRORS
+
+
+def is_auth_error(exc):
+    status = _status_of(exc)
+    if status is not None:
+        return status in AUTH_ERROR_STATUSES
+    return type(exc).__name__ in AUTH_ERRORS
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    fail fast for ``recovery_time`` seconds. Then one trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, recovery_time=BREAKER_RECOVERY_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.recovery_time:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """Raise UpstreamUnavailable unless a call may go out now"""
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return
+        metrics.incr(f"upstream.short_circuited.{self.name}")
+        retry_after = self.recovery_time - (time.monotonic() - self.opened_at) if state == "open" else 1
+        raise UpstreamUnavailable(self.name, retry_after)
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                metrics.incr(f"upstream.breaker_opened.{self.name}")
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """The call ended without a verdict (e.g. it was cancelled)"""
+        self._trial_running = False
+
+
+class LatencyTracker:
+    """Recent latencies of one operation, for picking the hedge delay"""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, q):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+_breakers = {}
+_latencies = {}
+
+
+def breaker_for(operation):
+    breaker = _breakers.get(operation)
+    if breaker is None:
+        breaker = _breakers[operation] = CircuitBreaker(operation)
+    return breaker
+
+
+def _latency_for(operation):
+    tracker = _latencies.get(operation)
+    if tracker is None:
+        tracker = _latencies[operation] = LatencyTracker()
+    return tracker
+
+
+def _stop_at_deadline(retry_state):
+    # Never sleep into (or past) the request's deadline
+    remaining = remaining_time()
+    return remaining is not None and remaining <= (retry_state.upcoming_sleep or 0)
+
+
+async def _attempt(circuit, func, timeout_kwarg, kwargs):
+    if timeout_kwarg is not None:
+        kwargs = {**kwargs, timeout_kwarg: remaining_time()}
+    started = time.monotonic()
+    result = await run_blocking(func, **kwargs)
+    _latency_for(circuit).add(time.monotonic() - started)
+    return result
+
+
+async def _hedged_attempt(operation, circuit, func, timeout_kwarg, kwargs):
+    """Send a duplicate request if the first is still running after the operation's p95 latency.
+
+    The first response wins. The loser's asyncio task is cancelled, but its
+    worker thread runs to completion.
+    """
+    p95 = _latency_for(circuit).percentile(0.95)
+    if operation not in HEDGE_OPERATIONS or p95 is None:
+        return await _attempt(circuit, func, timeout_kwarg, kwargs)
+
+    primary = asyncio.ensure_future(_attempt(circuit, func, timeout_kwarg, kwargs))
+    done, _ = await asyncio.wait({primary}, timeout=max(HEDGE_MIN_DELAY, p95))
+    if done:
+        return primary.result()
+
+    metrics.incr(f"upstream.hedged.{operation}")
+    hedge = asyncio.ensure_future(_attempt(circuit, func, timeout_kwarg, kwargs))
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        metrics.incr(f"upstream.hedge_won.{operation}")
+                    return task.result()
+        # Both failed: surface the primary's error
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_upstream(operation, func, timeout_kwarg=None, circuit=None, **kwargs):
+    """Run a blocking SDK call with retries, a circuit breaker and optional hedging.
+
+    Retryable errors (timeouts, connection errors, 429 and 5xx) are retried
+    with jittered exponential backoff, never past the request deadline.
+    ``timeout_kwarg`` names the SDK's per-call timeout argument, which gets
+    the time left before the deadline on every attempt. ``circuit`` names the
+    breaker (and latency history) to use, by default the operation's; callers
+    that can switch between backends give each its own. Final failures raise
+    UpstreamError: 502, or 422 when upstream refused the request itself.
+    A rejected API key (401/403) is a 502 that counts against the breaker,
+    with the upstream message kept out of the response. Running out of time raises 504, and an open circuit 503.
+    """
+    circuit = circuit or operation
+    breaker = breaker_for(circuit)
+    breaker.before_call()
+    retrying = AsyncRetrying(
+        stop=stop_after_attempt(UPSTREAM_RETRY_ATTEMPTS) | _stop_at_deadline,
+        wait=wait_random_exponential(multiplier=0.5, max=UPSTREAM_RETRY_MAX_WAIT),
+        retry=retry_if_exception(is_retryable),
+        before_sleep=lambda retry_state: metrics.incr(f"upstream.retries.{operation}"),
+        reraise=True,
+    )
+    try:
+        result = await retrying(_hedged_attempt, operation, circuit, func, timeout_kwarg, kwargs)
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except Exception as e:
+        metrics.incr(f"upstream.failures.{operation}")
+        if is_client_error(e):
+            # The request was refused; upstream itself is healthy
+            breaker.record_success()
+            raise UpstreamError(operation, str(e), status_code=422)
+        breaker.record_failure()
+        if is_auth_error(e):
+            logger.error("%s: upstream rejected our credentials: %s", operation, e)
+            raise UpstreamError(operation, "upstream service unavailable")
+        check_deadline(operation)
+        raise UpstreamError(operation, str(e))
+    breaker.record_success()
+    return result
+
+
+def breaker_states():
+    return {name: breaker.state for name, breaker in _breakers.items()}
+
+
+metrics.register_gauge("upstream.breakers", breaker_states)
@@ -0,0 +1,98 @@
+import heapq
+import itertools
+import time
+from collections import deque
+
+
+class _Entry:
+    __slots__ = ("finish", "seq", "flow", "item", "enqueued_at", "live")
+
+    def __init__(self, finish, seq, flow, item, enqueued_at):
+        self.finish = finish
+        self.seq = seq
+        self.flow = flow
+        self.item = item
+        self.enqueued_at = enqueued_at
+        self.live = True
+
+    def __lt__(self, other):
+        return (self.finish, self.seq) < (other.finish, other.seq)
+
+
+class WeightedFairQueue:
+    """Weighted fair queue over per-flow FIFO sub-queues (self-clocked WFQ).
+
+    Each push is stamped with a virtual finish tag of
+    ``max(virtual time, flow's last tag) + 1 / weight`` and pops go in tag
+    order, so backlogged flows share service in proportion to their weights
+    and one flow's burst only delays that flow. As starvation protection,
+    any entry queued for longer than ``starvation_after`` seconds is served
+    first, oldest first.
+    """
+
+    def __init__(self, starvation_after=5.0):
+        self.starvation_after = starvation_after
+        self.virtual_time = 0.0
+        self._heap = []
+        self._arrivals = deque()
+        self._last_finish = {}
+        self._seq = itertools.count()
+        self._live = 0
+
+    def __len__(self):
+        return self._live
+
+    def _finish_tag(self, flow, weight):
+        return max(self.virtual_time, self._last_finish.get(flow, 0.0)) + 1.0 / max(weight, 1e-6)
+
+    def position(self, flow, weight):
+        """How many queued entries would be served before a new push for ``flow``"""
+        finish = self._finish_tag(flow, weight)
+        return sum(1 for entry in self._heap if entry.live and entry.finish <= finish)
+
+    def push(self, flow, weight, item):
+        finish = self._finish_tag(flow, weight)
+        self._last_finish[flow] = finish
+        entry = _Entry(finish, next(self._seq), flow, item, time.monotonic())
+        heapq.heappush(self._heap, entry)
+        self._arrivals.append(entry)
+        self._live += 1
+        if len(self._last_finish) > 4 * self._live + 1024:
+            self._forget_idle_flows()
+        return entry
+
+    def remove(self, entry):
+        """Withdraw an entry (e.g. its waiter timed out); it is skipped lazily"""
+        if entry.live:
+            entry.live = False
+            self._live -= 1
+
+    def pop(self):
+        """Next entry to serve, or None when empty"""
+        entry = self._pop_starved() or self._pop_fair()
+        if entry is None:
+            return None
+        entry.live = False
+        self._live -= 1
+        self.virtual_time = max(self.virtual_time, entry.finish)
+        return entry
+
+    def _pop_starved(self):
+        while self._arrivals and not self._arrivals[0].live:
+            self._arrivals.popleft()
+        if self._arrivals and time.monotonic() - self._arrivals[0].enqueued_at > self.starvation_after:
+            return self._arrivals.popleft()
+        return None
+
+    def _pop_fair(self):
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if entry.live:
+                return entry
+        return None
+
+    def _forget_idle_flows(self):
+        # A flow whose last tag is behind virtual time restarts from virtual time anyway
+        self._last_finish = {
+            flow: finish for flow, finish in self._last_finish.items() if finish > self.virtual_time
+        }
@@ -1,16 +1,15 @@
+import time
 from datetime import datetime, timedelta
 from typing import Optional
-import os
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from dotenv import load_dotenv
+from app.core.config import settings
 
-load_dotenv()
 
 # Security settings
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+SECRET_KEY = settings.secret_key
+ALGORITHM = settings.algorithm
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -29,3 +28,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+# Decoded tokens by raw token string; tokens repeat on every request of a session
+_decoded_tokens = {}
+_DECODED_TOKENS_MAX = 10000
+
+def decode_access_token(token: str) -> Optional[dict]:
+    """Return the token's claims, or None if it is invalid or expired"""
+    payload = _decoded_tokens.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        if len(_decoded_tokens) >= _DECODED_TOKENS_MAX:
+            _decoded_tokens.clear()
+        _decoded_tokens[token] = payload
+    # Cached claims are re-checked for expiry on every use
+    if payload.get("exp", 0) <= time.time():
+        _decoded_tokens.pop(token, None)
+        return None
+    return payload
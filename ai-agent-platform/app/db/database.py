@@ -1,18 +1,192 @@
-import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from sqlalchemy.pool import StaticPool
+from app.core.metrics import metrics
+from app.core.config import settings
 
-load_dotenv()
 
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ai_platform.db")
+# An empty DATABASE_URL in .env falls back to the local SQLite file
+SQLALCHEMY_DATABASE_URL = settings.database_url
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# PostgreSQL pool settings
+DB_POOL_SIZE = settings.db_pool_size
+DB_MAX_OVERFLOW = settings.db_max_overflow
+DB_POOL_RECYCLE = settings.db_pool_recycle
+DB_POOL_TIMEOUT = settings.db_pool_timeout
+
+# SQLite tuning
+SQLITE_BUSY_TIMEOUT_MS = settings.sqlite_busy_timeout_ms
+SQLITE_MMAP_SIZE = settings.sqlite_mmap_size
+
+# Async driver used for each backend by the async session layer
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def normalize_database_url(url):
+    """Return a SQLAlchemy URL, accepting the legacy ``postgres://`` scheme"""
+    if isinstance(url, str) and url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return make_url(url)
+
+
+def _is_memory_sqlite(url):
+    return url.database in (None, "", ":memory:")
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Per-connection SQLite tuning.
+
+    WAL lets readers run alongside a writer, and the busy timeout makes a
+    second writer wait for the lock instead of failing with
+    ``database is locked``.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+    # Let SQLAlchemy, not the driver, emit BEGIN so SAVEPOINTs behave (see _begin_sqlite_transaction)
+    dbapi_connection.isolation_level = None
+
+
+def _begin_sqlite_transaction(connection):
+    # "IMMEDIATE" takes the write lock up front (waiting up to busy_timeout). A
+    # deferred transaction that reads and then writes fails outright with
+    # "database is locked" if another writer committed in between.
+    mode = connection.get_execution_options().get("sqlite_begin")
+    connection.exec_driver_sql(f"BEGIN {mode}" if mode else "BEGIN")
+
+
+def sqlite_engine_options(url):
+    options = {
+        "connect_args": {
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+    }
+    if _is_memory_sqlite(url):
+        # Every new connection to :memory: would be a fresh, empty database
+        options["poolclass"] = StaticPool
+    return options
+
+
+def postgres_engine_options():
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": True,
+    }
+
+
+def instrument_pool(engine, name):
+    """Count pool events and expose the pool state as a gauge under ``db.<name>``"""
+    prefix = f"db.{name}"
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        metrics.incr(f"{prefix}.connections_opened")
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.incr(f"{prefix}.checkouts")
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.incr(f"{prefix}.invalidated")
+
+    def pool_state():
+        pool = engine.pool
+        state = {"status": pool.status()}
+        for attr in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, attr):
+                state[attr] = getattr(pool, attr)()
+        return state
+
+    metrics.register_gauge(f"{prefix}.pool", pool_state)
+
+
+def create_db_engine(database_url=SQLALCHEMY_DATABASE_URL, name="default", **overrides):
+    """Build an engine tuned for the target backend.
+
+    SQLite gets WAL, ``synchronous=NORMAL``, a busy timeout and mmap; server
+    databases get a sized, recycled, pre-pinged connection pool. Keyword
+    arguments override the computed options.
+    """
+    url = normalize_database_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        options = sqlite_engine_options(url)
+    else:
+        options = postgres_engine_options()
+    options.update(overrides)
+
+    engine = create_engine(url, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        event.listen(engine, "begin", _begin_sqlite_transaction)
+    instrument_pool(engine, name)
+    return engine
+
+
+def to_async_url(database_url):
+    """Swap the sync driver in ``database_url`` for its async counterpart"""
+    url = normalize_database_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database backend: {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def create_async_db_engine(database_url=SQLALCHEMY_DATABASE_URL, name="async", **overrides):
+    """Async counterpart of create_db_engine (aiosqlite / asyncpg), with the same tuning"""
+    url = to_async_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        options = sqlite_engine_options(url)
+    else:
+        options = postgres_engine_options()
+    options.update(overrides)
+
+    async_engine = create_async_engine(url, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        event.listen(async_engine.sync_engine, "begin", _begin_sqlite_transaction)
+    instrument_pool(async_engine.sync_engine, name)
+    return async_engine
+
+
+def dialect_insert(dialect_name):
+    """Return the dialect's INSERT construct, which supports ON CONFLICT clauses"""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+# For transactions that read before they write; only changes behaviour on SQLite
+AsyncWriteSessionLocal = async_sessionmaker(
+    async_engine.execution_options(sqlite_begin="IMMEDIATE"),
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
 # Dependency
@@ -22,3 +196,13 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Async dependency for async route handlers
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Async dependency for handlers that read and then write
+async def get_async_write_db():
+    async with AsyncWriteSessionLocal() as db:
+        yield db
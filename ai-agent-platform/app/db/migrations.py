@@ -0,0 +1,162 @@
+"""Lightweight, ordered schema migrations.
+
+``Base.metadata.create_all`` only creates missing tables; it never adds
+indexes, constraints or columns to tables that already exist. Each migration
+here runs once per database, in version order, and is recorded in the
+``schema_migrations`` table.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, false, func, inspect, select, text, true
+
+from app.models.models import Base, Subscription, UserContent
+
+logger = logging.getLogger(__name__)
+
+# Kept out of the models metadata so create_all never touches it
+migration_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+MIGRATIONS = []
+
+# Arbitrary key for the PostgreSQL advisory lock serialising concurrent runners
+_PG_LOCK_KEY = 7261340
+
+
+def migration(version, description):
+    """Register a migration function taking an open connection"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return decorator
+
+
+def _index(table, name):
+    for index in table.indexes:
+        if index.name == name:
+            return index
+    raise KeyError(name)
+
+
+@migration(1, "Composite subscription/content indexes and one active subscription per user")
+def _subscription_and_content_indexes(conn):
+    subscriptions = Subscription.__table__
+
+    # Keep only the newest active subscription per user so the unique index can be built
+    newest_active = (
+        select(func.max(subscriptions.c.id))
+        .where(subscriptions.c.is_active == true())
+        .group_by(subscriptions.c.user_id)
+    )
+    conn.execute(
+        subscriptions.update()
+        .where(subscriptions.c.is_active == true())
+        .where(subscriptions.c.id.not_in(newest_active))
+        .values(is_active=false())
+    )
+
+    for name in ("ix_subscriptions_user_id_is_active", "uq_subscriptions_user_id_active"):
+        _index(subscriptions, name).create(conn, checkfirst=True)
+    _index(UserContent.__table__, "ix_user_contents_user_id_created_at").create(conn, checkfirst=True)
+
+
+@migration(2, "Index for the subscription expiry sweep")
+def _subscription_expiry_index(conn):
+    _index(Subscription.__table__, "ix_subscriptions_is_active_end_date").create(conn, checkfirst=True)
+
+
+@migration(3, "Index subscriptions by Stripe subscription id")
+def _stripe_subscription_id_index(conn):
+    _index(Subscription.__table__, "ix_subscriptions_stripe_subscription_id").create(conn, checkfirst=True)
+
+
+@migration(4, "Add id to the per-user content history index for keyset pagination")
+def _content_history_keyset_index(conn):
+    # Same name, one more column: rebuild it (cheap on databases created with it already)
+    index = _index(UserContent.__table__, "ix_user_contents_user_id_created_at")
+    index.drop(conn, checkfirst=True)
+    index.create(conn)
+
+
+# Full-text index over prompt + output_text. SQLite: an external-content FTS5
+# table kept in sync by triggers. PostgreSQL: a generated tsvector column with
+# a GIN index. Both are maintained by the database on every insert.
+_SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_contents_fts USING fts5(
+        prompt, output_text,
+        content='user_contents', content_rowid='id',
+        tokenize='porter unicode61', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS user_contents_fts_ai AFTER INSERT ON user_contents BEGIN
+        INSERT INTO user_contents_fts(rowid, prompt, output_text) VALUES (new.id, new.prompt, new.output_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_contents_fts_ad AFTER DELETE ON user_contents BEGIN
+        INSERT INTO user_contents_fts(user_contents_fts, rowid, prompt, output_text)
+        VALUES ('delete', old.id, old.prompt, old.output_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_contents_fts_au AFTER UPDATE OF prompt, output_text ON user_contents BEGIN
+        INSERT INTO user_contents_fts(user_contents_fts, rowid, prompt, output_text)
+        VALUES ('delete', old.id, old.prompt, old.output_text);
+        INSERT INTO user_contents_fts(rowid, prompt, output_text) VALUES (new.id, new.prompt, new.output_text);
+    END""",
+    # Index rows that existed before the table did
+    "INSERT INTO user_contents_fts(user_contents_fts) VALUES ('rebuild')",
+]
+
+_POSTGRES_FTS = [
+    """ALTER TABLE user_contents ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(prompt, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(output_text, '')), 'B')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_user_contents_search_vector ON user_contents USING gin (search_vector)",
+]
+
+
+@migration(5, "Output text column and full-text search index on content history")
+def _content_full_text_search(conn):
+    columns = {column["name"] for column in inspect(conn).get_columns("user_contents")}
+    if "output_text" not in columns:
+        conn.execute(text("ALTER TABLE user_contents ADD COLUMN output_text TEXT"))
+
+    statements = {"sqlite": _SQLITE_FTS, "postgresql": _POSTGRES_FTS}.get(conn.dialect.name)
+    if statements is None:
+        logger.warning("No full-text index for dialect %s; content search is unavailable", conn.dialect.name)
+        return
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+def run_migrations(engine):
+    """Apply pending migrations; returns the versions applied"""
+    applied_now = []
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Several workers may boot at once; only one migrates, the rest wait
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _PG_LOCK_KEY})
+
+        migration_metadata.create_all(conn, checkfirst=True)
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+        for version, description, func in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info("Applying migration %s: %s", version, description)
+            func(conn)
+            conn.execute(schema_migrations.insert().values(version=version, description=description))
+            applied_now.append(version)
+
+    return applied_now
+
+
+def setup_database(engine):
+    """Create missing tables, then apply pending migrations"""
+    Base.metadata.create_all(bind=engine)
+    return run_migrations(engine)
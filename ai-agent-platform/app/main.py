@@ -1,20 +1,118 @@
-import os
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from app.db.database import engine, get_db
-from app.models import models
-from dotenv import load_dotenv
-from app.api.routes import auth, ai_tools, subscription
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import text
+from app.db.database import engine, async_engine
+from app.db.migrations import setup_database
+from app.api.routes import account, auth, ai_tools, content, subscription
+from app.core.background import PeriodicTask
+from app.core.body_limit import BodySizeLimitMiddleware
+from app.core.config import settings
+from app.core.deadlines import RequestDeadlineMiddleware
+from app.core.executors import run_blocking, run_render, shutdown_executors
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.loop_monitor import loop_monitor
+from app.core.metrics import metrics
+from app.core.rate_limit import RateLimitMiddleware
+from app.services import renderers, token_budget
+from app.services.code_session_service import CODE_SESSION_PURGE_INTERVAL, CodeSessionService
+from app.services.content_service import content_buffer
+from app.services.entitlement_service import EntitlementService, SUBSCRIPTION_SWEEP_INTERVAL
+from app.services.openai_service import openai_sdk
+from app.services.stripe_event_service import stripe_event_consumer
+from app.services.usage_service import USAGE_ROLLUP_INTERVAL, rollup_recent_usage, usage_buffer
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+async def warm_up():
+    """Load the lazily imported SDKs and document templates in the background,
+    so neither startup nor the first requests pay for them"""
+    started = time.perf_counter()
+    try:
+        await run_render(renderers.warm_up)
+        await run_blocking(token_budget.warm_up)
+        await openai_sdk.load()
+        await subscription.stripe_sdk.load()
+    except Exception:
+        logger.exception("Warm-up failed; modules will load on first use instead")
+        return
+    metrics.observe("startup.warm_up_ms", (time.perf_counter() - started) * 1000)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.status = "starting"
+    started = time.perf_counter()
+    # Watch for handlers that block the event loop
+    await loop_monitor.start()
+    # Schema setup: create missing tables, then apply pending migrations
+    # (app.serve does this once in the master before forking workers)
+    if not getattr(app.state, "database_prepared", False):
+        await run_blocking(setup_database, engine)
+    warm_up_task = asyncio.create_task(warm_up())
+    # Deactivate subscriptions whose end date has passed
+    subscription_sweeper = PeriodicTask(
+        "subscription_sweep", SUBSCRIPTION_SWEEP_INTERVAL, EntitlementService.expire_lapsed_subscriptions
+    )
+    subscription_sweeper.start()
+    # Apply stored Stripe webhook events
+    stripe_event_consumer.start()
+    # Usage ledger: batched event writes plus daily per-user rollups
+    usage_buffer.start()
+    usage_rollup = PeriodicTask("usage_rollup", USAGE_ROLLUP_INTERVAL, rollup_recent_usage)
+    usage_rollup.start()
+    # Generation history, written in batches off the request path
+    content_buffer.start()
+    # Drop idle code-assistant sessions
+    code_session_purge = PeriodicTask(
+        "code_session_purge", CODE_SESSION_PURGE_INTERVAL, CodeSessionService.purge_expired
+    )
+    code_session_purge.start()
+    app.state.status = "ready"
+    metrics.observe("startup.lifespan_ms", (time.perf_counter() - started) * 1000)
+    yield
+    # Fail readiness first so load balancers stop sending traffic while this worker drains
+    app.state.status = "draining"
+    warm_up_task.cancel()
+    await code_session_purge.stop()
+    await content_buffer.stop()
+    await usage_rollup.stop()
+    await usage_buffer.stop()
+    await rollup_recent_usage()
+    await stripe_event_consumer.stop()
+    await subscription_sweeper.stop()
+    await loop_monitor.stop()
+    await async_engine.dispose()
+    shutdown_executors(wait=True)
+
+# orjson (when installed) serializes responses several times faster than the json module
+try:
+    import orjson  # noqa: F401
+    DefaultResponse = ORJSONResponse
+except ImportError:
+    DefaultResponse = JSONResponse
 
 # Initialize FastAPI app
-app = FastAPI(title="AI Agent Platform")
+app = FastAPI(title="AI Agent Platform", lifespan=lifespan, default_response_class=DefaultResponse)
+
+# Deadlines and client-disconnect cancellation for the AI tools (innermost: only admitted requests pay for it)
+app.add_middleware(RequestDeadlineMiddleware)
+
+# Per-user, plan-aware rate limits on the AI tools (added before CORS so CORS wraps its 429s)
+app.add_middleware(RateLimitMiddleware)
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Retries carrying an Idempotency-Key replay the first result (outside the rate limiter: replays are free)
+app.add_middleware(IdempotencyMiddleware)
+
+# Oversized request bodies are refused before anything buffers them
+app.add_middleware(BodySizeLimitMiddleware)
+
+# Compress large responses (generated code and documents, content history)
+app.add_middleware(GZipMiddleware, minimum_size=settings.gzip_minimum_size, compresslevel=5)
 
 # Configure CORS
 app.add_middleware(
@@ -28,12 +126,33 @@ app.add_middleware(
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(ai_tools.router, prefix="/api/tools", tags=["AI Tools"])
+app.include_router(account.router, prefix="/api/me", tags=["Account"])
+app.include_router(content.router, prefix="/api/content", tags=["Content"])
 app.include_router(subscription.router, prefix="/api/subscription", tags=["Subscription"])
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to AI Agent Platform"}
 
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 200 once startup has finished and the database answers, else 503"""
+    status = getattr(app.state, "status", "starting")
+    if status != "ready":
+        return JSONResponse(status_code=503, content={"status": status})
+    try:
+        async with async_engine.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), timeout=2)
+    except Exception:
+        return JSONResponse(status_code=503, content={"status": "database unavailable"})
+    return {"status": status}
+
+@app.get("/metrics")
+async def get_metrics():
+    """In-process metrics for this worker"""
+    return metrics.snapshot()
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    # Production server; for development use `uvicorn app.main:app --reload`
+    from app.serve import main
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Float
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Date, DateTime, Float, Index, Text, true
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -28,9 +28,24 @@ class Subscription(Base):
     start_date = Column(DateTime, default=datetime.utcnow)
     end_date = Column(DateTime)
     stripe_customer_id = Column(String, nullable=True)
-    stripe_subscription_id = Column(String, nullable=True)
+    stripe_subscription_id = Column(String, nullable=True, index=True)
     
     user = relationship("User", back_populates="subscription")
+    
+    __table_args__ = (
+        # Status, checkout and webhook lookups all filter on (user_id, is_active)
+        Index("ix_subscriptions_user_id_is_active", "user_id", "is_active"),
+        # Expiry sweep: active rows past their end date
+        Index("ix_subscriptions_is_active_end_date", "is_active", "end_date"),
+        # At most one active subscription per user
+        Index(
+            "uq_subscriptions_user_id_active",
+            "user_id",
+            unique=True,
+            sqlite_where=is_active == true(),
+            postgresql_where=is_active == true(),
+        ),
+    )
 
 class UserContent(Base):
     __tablename__ = "user_contents"
@@ -41,5 +56,84 @@ class UserContent(Base):
     file_path = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     prompt = Column(String)
+    output_text = Column(Text, nullable=True)  # Searchable text of the result (code, document body, slide outline)
     
     user = relationship("User", back_populates="contents")
+    
+    __table_args__ = (
+        # Per-user history, newest first; id breaks created_at ties for keyset pagination
+        Index("ix_user_contents_user_id_created_at", "user_id", "created_at", "id"),
+    )
+
+class StripeEvent(Base):
+    """Inbox of verified Stripe webhook events, keyed by Stripe's event id"""
+    __tablename__ = "stripe_events"
+    
+    id = Column(String, primary_key=True)  # Stripe event id, e.g. 'evt_...'
+    type = Column(String)
+    payload = Column(Text)  # Raw JSON body as received
+    received_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, nullable=True)
+    
+    __table_args__ = (
+        # Consumer scans unprocessed events oldest first
+        Index("ix_stripe_events_processed_at_received_at", "processed_at", "received_at"),
+    )
+
+class UsageEvent(Base):
+    """One upstream call: tokens, images or TTS characters consumed, and latency"""
+    __tablename__ = "usage_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # None for anonymous calls
+    operation = Column(String)  # 'text', 'code', 'image', 'tts'
+    endpoint = Column(String, nullable=True)
+    model = Column(String, nullable=True)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    images = Column(Integer, default=0)
+    tts_characters = Column(Integer, default=0)
+    latency_ms = Column(Float, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Daily rollups scan one day of events at a time
+        Index("ix_usage_events_created_at", "created_at"),
+        Index("ix_usage_events_user_id_created_at", "user_id", "created_at"),
+    )
+
+class UsageDaily(Base):
+    """Per-user, per-day, per-operation usage totals rolled up from usage_events"""
+    __tablename__ = "usage_daily"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    operation = Column(String, primary_key=True)
+    requests = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    images = Column(Integer, default=0)
+    tts_characters = Column(Integer, default=0)
+    latency_ms_total = Column(Float, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class CodeSession(Base):
+    """A code-assistant conversation: recent turns verbatim, older ones folded into a summary"""
+    __tablename__ = "code_sessions"
+
+    id = Column(String, primary_key=True)  # random, unguessable token
+    caller = Column(String)  # owner: 'user:<id>' or 'ip:<address>' for anonymous callers
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    language = Column(String)
+    task = Column(String, nullable=True)  # 'write', 'debug', 'explain', 'optimize'
+    summary = Column(Text, nullable=True)
+    turns = Column(Text, default="[]")  # JSON list of {"role", "content"} messages after the summary
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Expiry sweep
+        Index("ix_code_sessions_updated_at", "updated_at"),
+    )
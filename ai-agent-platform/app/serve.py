@@ -0,0 +1,205 @@
+"""Production server: a pre-forking master supervising uvicorn workers.
+
+    python -m app.serve --workers 4
+
+The master imports the app once, together with the SDKs and document
+libraries the app otherwise loads lazily, prepares the database schema, binds
+the listening socket and then forks the workers. Workers share the preloaded
+modules copy-on-write and all accept on the same socket. Anything that must
+not cross a fork (database connections, executors, the event loop and the
+background tasks) is created per worker, right after the fork or by the
+app's lifespan.
+
+SIGTERM or SIGINT to the master shuts down gracefully: every worker stops
+accepting, finishes its in-flight requests (up to ``--graceful-timeout``
+seconds), runs the lifespan shutdown (flushing the write-behind buffers) and
+exits. Workers that die unexpectedly are replaced.
+"""
+import argparse
+import gc
+import importlib.util
+import logging
+import os
+import signal
+import time
+import uvicorn
+
+from app.core.config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Extra time, on top of the graceful timeout, for a worker's lifespan shutdown
+SHUTDOWN_GRACE = 15
+# A worker that exits sooner than this after starting is restarted with a delay
+MIN_WORKER_UPTIME = 5.0
+
+
+def _resolve(choice, module, fallback):
+    """Use an optional accelerator only when it is installed"""
+    if choice == module and importlib.util.find_spec(module) is None:
+        logger.warning("%s is not installed; using %s", module, fallback)
+        return fallback
+    return choice
+
+
+def preload():
+    """Import and prepare everything workers can share, before the first fork"""
+    from app.api.routes.subscription import stripe_sdk
+    from app.db.database import engine
+    from app.db.migrations import setup_database
+    from app.main import app
+    from app.services import renderers, token_budget
+    from app.services.openai_service import openai_sdk
+
+    # Once here instead of racing in every worker's lifespan
+    setup_database(engine)
+    app.state.database_prepared = True
+
+    for warm_up in (openai_sdk.get, stripe_sdk.get, renderers.warm_up, token_budget.warm_up):
+        try:
+            warm_up()
+        except Exception:
+            logger.exception("Preloading failed; workers will load it on first use")
+
+    # Connections must never be shared across a fork
+    engine.dispose()
+    # Move the preloaded objects out of the collector's reach, so collections
+    # in the workers do not write to (and so copy) the shared pages
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def after_fork():
+    """Reset per-process state inherited from the master"""
+    from app.db.database import async_engine, engine
+
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    # Forget the master's pools without closing connections that are not ours
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+
+class WorkerServer(uvicorn.Server):
+    def handle_exit(self, sig, frame):
+        # Fail readiness straight away; in-flight requests carry on until done
+        self.config.app.state.status = "draining"
+        super().handle_exit(sig, frame)
+
+
+class Master:
+    def __init__(self, config, workers, graceful_timeout):
+        self.config = config
+        self.num_workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}  # pid -> start time
+        self.stopping = False
+        self.sock = None
+
+    def run(self):
+        self.sock = self.config.bind_socket()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        logger.info("Master %s starting %d workers", os.getpid(), self.num_workers)
+
+        while not self.stopping:
+            self._reap()
+            while len(self.workers) < self.num_workers and not self.stopping:
+                self._spawn()
+            time.sleep(0.5)
+
+        self._shutdown()
+
+    def _handle_stop(self, sig, frame):
+        self.stopping = True
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                after_fork()
+                WorkerServer(self.config).run(sockets=[self.sock])
+            except BaseException:
+                logger.exception("Worker %s crashed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logger.warning("Worker %s exited with status %s; replacing it", pid, status)
+            if time.monotonic() - started < MIN_WORKER_UPTIME:
+                # Crashing on boot; do not spin
+                time.sleep(1)
+
+    def _shutdown(self):
+        logger.info("Shutting down %d workers", len(self.workers))
+        for pid in list(self.workers):
+            self._signal(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.graceful_timeout + SHUTDOWN_GRACE
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+
+        for pid in list(self.workers):
+            logger.warning("Worker %s did not stop in time; killing it", pid)
+            self._signal(pid, signal.SIGKILL)
+        while self.workers:
+            self._reap()
+            time.sleep(0.1)
+        self.sock.close()
+
+    def _signal(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            self.workers.pop(pid, None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API with several pre-forked uvicorn workers")
+    parser.add_argument("--host", default=settings.host)
+    parser.add_argument("--port", type=int, default=settings.port)
+    parser.add_argument("--workers", type=int, default=settings.web_concurrency)
+    parser.add_argument("--loop", choices=["auto", "asyncio", "uvloop"], default=settings.server_loop)
+    parser.add_argument("--http", choices=["auto", "h11", "httptools"], default=settings.server_http)
+    parser.add_argument("--backlog", type=int, default=settings.server_backlog)
+    parser.add_argument("--graceful-timeout", type=int, default=settings.graceful_timeout)
+    parser.add_argument("--log-level", default=settings.log_level)
+    args = parser.parse_args(argv)
+
+    app = preload()
+    config = uvicorn.Config(
+        app,
+        host=args.host,
+        port=args.port,
+        loop=_resolve(args.loop, "uvloop", "asyncio"),
+        http=_resolve(args.http, "httptools", "h11"),
+        backlog=args.backlog,
+        lifespan="on",
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+    if args.workers <= 1 or not hasattr(os, "fork"):
+        # Single process (or no fork on this platform): serve in the foreground
+        WorkerServer(config).run()
+        return
+    Master(config, args.workers, args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    main()
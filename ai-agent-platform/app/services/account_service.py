@@ -0,0 +1,103 @@
+from datetime import datetime
+from typing import Optional
+from cachetools import TTLCache
+from sqlalchemy import func, select, true
+from sqlalchemy.orm import contains_eager
+
+from app.core.metrics import metrics
+from app.db.database import AsyncSessionLocal
+from app.models.models import Subscription, UsageDaily, User, UserContent
+from app.services.entitlement_service import DEFAULT_PLAN
+from app.core.config import settings
+
+
+# Dashboards poll; a few seconds of staleness is fine and spares the database
+ACCOUNT_CACHE_TTL = settings.account_cache_ttl
+ACCOUNT_CACHE_SIZE = settings.account_cache_size
+
+_cache = TTLCache(maxsize=ACCOUNT_CACHE_SIZE, ttl=ACCOUNT_CACHE_TTL)
+
+
+def _usage_total(column, user_id, since):
+    return (
+        select(func.coalesce(func.sum(column), 0))
+        .where(UsageDaily.user_id == user_id, UsageDaily.day >= since)
+        .scalar_subquery()
+    )
+
+
+class AccountService:
+    @staticmethod
+    async def get_summary(user_id: int) -> Optional[dict]:
+        """User, active subscription, content and month-to-date usage totals; None if the user is gone"""
+        summary = _cache.get(user_id)
+        if summary is not None:
+            metrics.incr("account.cache_hits")
+            return summary
+
+        metrics.incr("account.cache_misses")
+        summary = await AccountService._load(user_id)
+        if summary is not None:
+            _cache[user_id] = summary
+        return summary
+
+    @staticmethod
+    def invalidate(user_id: Optional[int] = None):
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+    @staticmethod
+    async def _load(user_id: int) -> Optional[dict]:
+        # Usage rollups are daily; the period is the calendar month so far (UTC)
+        period_start = datetime.utcnow().date().replace(day=1)
+        # One round trip: the active subscription is joined in and eagerly
+        # loaded, every aggregate is an index-backed scalar subquery
+        query = (
+            select(
+                User,
+                select(func.count(UserContent.id)).where(UserContent.user_id == user_id)
+                .scalar_subquery().label("content_count"),
+                select(func.max(UserContent.created_at)).where(UserContent.user_id == user_id)
+                .scalar_subquery().label("last_content_at"),
+                _usage_total(UsageDaily.requests, user_id, period_start).label("requests"),
+                _usage_total(UsageDaily.prompt_tokens, user_id, period_start).label("prompt_tokens"),
+                _usage_total(UsageDaily.completion_tokens, user_id, period_start).label("completion_tokens"),
+                _usage_total(UsageDaily.images, user_id, period_start).label("images"),
+                _usage_total(UsageDaily.tts_characters, user_id, period_start).label("tts_characters"),
+            )
+            .outerjoin(User.subscription.and_(Subscription.is_active == true()))
+            .options(contains_eager(User.subscription))
+            .where(User.id == user_id)
+        )
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(query)).first()
+
+        if row is None:
+            return None
+        user, subscription = row.User, row.User.subscription
+        return {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "created_at": user.created_at,
+            "plan": subscription.plan_type if subscription and subscription.plan_type else DEFAULT_PLAN,
+            "subscription": None if subscription is None else {
+                "id": subscription.id,
+                "plan_type": subscription.plan_type,
+                "is_active": subscription.is_active,
+                "start_date": subscription.start_date,
+                "end_date": subscription.end_date,
+            },
+            "content_count": row.content_count,
+            "last_content_at": row.last_content_at,
+            "usage": {
+                "period_start": period_start,
+                "requests": row.requests,
+                "prompt_tokens": row.prompt_tokens,
+                "completion_tokens": row.completion_tokens,
+                "images": row.images,
+                "tts_characters": row.tts_characters,
+            },
+        }
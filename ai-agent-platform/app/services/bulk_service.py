@@ -0,0 +1,229 @@
+"""Bulk generation: many prompts from one uploaded file, one ZIP back.
+
+The upload reaches the form parser unbuffered (see the deadline and
+idempotency middlewares), which spools it to disk past 1 MB. It is then
+copied to a private temporary file (the request's own copy is closed once
+the handler returns) and read back a row at a time on the I/O threads. At
+most ``BULK_CONCURRENCY`` rows are generated at once. Each finished file is
+added to the archive and sent straight away. Memory holds the rows in
+flight, a chunk of archive and the archive's central directory, which
+grows by about a hundred bytes per row. ``manifest.csv`` closes the
+archive with one line per row: ok with its file name, or failed with the
+reason.
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.core.executors import iterate_blocking, run_blocking
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BULK_CONCURRENCY = settings.bulk_concurrency
+BULK_MAX_ROWS = settings.bulk_max_rows
+CHUNK_SIZE = 64 * 1024
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+# Already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = {".docx", ".pptx", ".png", ".mp3"}
+
+
+class BulkInputError(HTTPException):
+    """400 for an upload that cannot be read as rows of prompts"""
+
+    def __init__(self, detail):
+        super().__init__(status_code=400, detail=detail)
+
+
+def upload_format(filename):
+    fmt = FORMATS.get(os.path.splitext(filename or "")[1].lower())
+    if fmt is None:
+        raise BulkInputError("Upload a .csv or .jsonl file")
+    return fmt
+
+
+def read_rows(source, fmt):
+    """(row number, fields, error) for each row of a binary file; one of fields and error is None"""
+    if fmt == "jsonl":
+        number = 0
+        for line in source:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                fields = json.loads(line)
+            except ValueError as e:
+                yield number, None, f"Invalid JSON: {e}"
+                continue
+            if isinstance(fields, dict):
+                yield number, fields, None
+            else:
+                yield number, None, "Expected a JSON object"
+        return
+
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        header = [name.strip().lower() for name in next(reader, [])]
+        if "prompt" not in header:
+            raise BulkInputError("The CSV needs a header row with a 'prompt' column")
+        for number, values in enumerate(reader, 1):
+            yield number, {name: value for name, value in zip(header, values) if name}, None
+    except csv.Error as e:
+        raise BulkInputError(f"Malformed CSV near line {reader.line_num}: {e}")
+    except UnicodeDecodeError:
+        raise BulkInputError("The CSV must be UTF-8 encoded")
+    finally:
+        # Leave ``source`` open for the caller
+        text.detach()
+
+
+def spool_upload(source, fmt, max_rows=BULK_MAX_ROWS):
+    """Copy an upload into a new temporary file, checking it parses and is not too long.
+
+    Blocking: run it on the I/O threads. Returns the file, rewound.
+    """
+    spooled = tempfile.TemporaryFile()
+    try:
+        shutil.copyfileobj(source, spooled, CHUNK_SIZE)
+        spooled.seek(0)
+        rows = sum(1 for _ in read_rows(spooled, fmt))
+        if not rows:
+            raise BulkInputError("The file has no rows")
+        if rows > max_rows:
+            raise BulkInputError(f"The file has {rows} rows; at most {max_rows} are allowed per upload")
+        spooled.seek(0)
+        return spooled
+    except BaseException:
+        spooled.close()
+        raise
+
+
+class _Sink(io.RawIOBase):
+    """Unseekable write-only file; ``drain`` hands over what was written since the last call"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """A ZIP archive produced piece by piece.
+
+    zipfile writes to an unseekable file by putting each entry's sizes in a
+    data descriptor after its contents, so every chunk can be sent as soon
+    as it is written. Only the central directory (a few dozen bytes per
+    entry) is kept until ``close``. Blocking: use from the I/O threads.
+    """
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w")
+
+    def add(self, name, source):
+        """Yield the archive bytes for a new entry ``name`` holding the rest of the binary file ``source``"""
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        stored = os.path.splitext(name)[1].lower() in STORED_EXTENSIONS
+        info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        with self._zip.open(info, "w") as entry:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                entry.write(chunk)
+                data = self._sink.drain()
+                if data:
+                    yield data
+        yield self._sink.drain()
+
+    def add_file(self, name, path):
+        with open(path, "rb") as source:
+            yield from self.add(name, source)
+
+    def close(self):
+        """The archive's final bytes (central directory)"""
+        self._zip.close()
+        return self._sink.drain()
+
+
+async def _run_row(number, fields, error, generate):
+    """(row number, file path or None, error or None)"""
+    if error is not None:
+        return number, None, error
+    try:
+        return number, await generate(fields), None
+    except ValidationError as e:
+        return number, None, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+    except HTTPException as e:
+        return number, None, str(e.detail)
+    except Exception:
+        logger.exception("Bulk generation failed for row %s", number)
+        return number, None, "Internal error"
+
+
+async def stream_archive(spooled, fmt, generate, concurrency=BULK_CONCURRENCY):
+    """Archive bytes for every row of ``spooled``, as rows finish; closes ``spooled``.
+
+    ``generate(fields)`` makes one row's file and returns its path. Files are
+    named ``row-00001.ext`` by row number and added in completion order.
+    """
+    archive = ZipStream()
+    manifest = tempfile.TemporaryFile()
+    report_text = io.TextIOWrapper(manifest, encoding="utf-8", newline="")
+    report = csv.writer(report_text)
+    report.writerow(["row", "status", "file", "error"])
+    rows = read_rows(spooled, fmt)
+    pending = set()
+    try:
+        while True:
+            while len(pending) < concurrency:
+                row = await run_blocking(next, rows, None)
+                if row is None:
+                    break
+                pending.add(asyncio.ensure_future(_run_row(*row, generate)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda t: t.result()[0]):
+                number, path, error = task.result()
+                if error is not None:
+                    metrics.incr("bulk.rows.failed")
+                    report.writerow([number, "failed", "", error])
+                    continue
+                name = f"row-{number:05d}{os.path.splitext(path)[1]}"
+                async for chunk in iterate_blocking(archive.add_file(name, path)):
+                    if chunk:
+                        yield chunk
+                metrics.incr("bulk.rows.ok")
+                report.writerow([number, "ok", name, ""])
+
+        report_text.flush()
+        manifest.seek(0)
+        async for chunk in iterate_blocking(archive.add("manifest.csv", manifest)):
+            if chunk:
+                yield chunk
+        yield await run_blocking(archive.close)
+    finally:
+        for task in pending:
+            task.cancel()
+        rows.close()
+        report_text.close()
+        spooled.close()
@@ -0,0 +1,129 @@
+import json
+import secrets
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+
+from app.core.metrics import metrics
+from app.db.database import AsyncSessionLocal, AsyncWriteSessionLocal
+from app.models.models import CodeSession
+from app.services.openai_service import OpenAIService
+from app.services.token_budget import count_tokens
+from app.core.config import settings
+
+# History sent with each follow-up; older turns are folded into the summary
+CODE_SESSION_CONTEXT_TOKENS = settings.code_session_context_tokens
+CODE_SESSION_TTL = timedelta(seconds=settings.code_session_ttl)
+CODE_SESSION_PURGE_INTERVAL = settings.code_session_purge_interval
+# Messages never folded: the latest request and the code that answered it
+KEEP_RECENT_MESSAGES = 2
+SUMMARY_MAX_TOKENS = 500
+
+SUMMARY_PROMPT = (
+    "Summarize this {language} coding conversation for a programmer who will continue it. "
+    "Keep the requirements, constraints, decisions made, and the names and signatures of the "
+    "functions and classes involved. Leave out code that later messages replaced. "
+    "Be concise.\n\n{previous}{transcript}"
+)
+
+
+class CodeSessionNotFound(HTTPException):
+    """404 for unknown, expired or someone else's sessions"""
+
+    def __init__(self):
+        super().__init__(status_code=404, detail="Code session not found or expired")
+
+
+def _tokens(messages):
+    return sum(count_tokens(m["content"]) for m in messages)
+
+
+class CodeSessionService:
+    @staticmethod
+    def start(caller: str, user_id: Optional[int], language: str, task: Optional[str]) -> CodeSession:
+        """A new session; it is stored along with its first turn"""
+        return CodeSession(
+            id=secrets.token_urlsafe(16), caller=caller, user_id=user_id,
+            language=language, task=task, summary=None, turns="[]",
+        )
+
+    @staticmethod
+    async def get(session_id: str, caller: str) -> CodeSession:
+        async with AsyncSessionLocal() as db:
+            session = await db.get(CodeSession, session_id)
+        if session is None or session.caller != caller or session.updated_at < datetime.utcnow() - CODE_SESSION_TTL:
+            raise CodeSessionNotFound()
+        return session
+
+    @staticmethod
+    async def context(session: CodeSession, prompt: str) -> List[dict]:
+        """Messages to send before ``prompt``: the summary, then the recent turns.
+
+        When they would not fit the token budget together with ``prompt``,
+        the older turns are summarized first (one extra, short completion).
+        """
+        turns = json.loads(session.turns or "[]")
+        budget = CODE_SESSION_CONTEXT_TOKENS - count_tokens(prompt)
+        summary_tokens = count_tokens(session.summary) if session.summary else 0
+        if len(turns) > KEEP_RECENT_MESSAGES and summary_tokens + _tokens(turns) > budget:
+            older, turns = turns[:-KEEP_RECENT_MESSAGES], turns[-KEEP_RECENT_MESSAGES:]
+            # Remembered for record_turn: the summary replaced and how many messages it absorbed
+            session._compacted = (session.summary, len(older))
+            session.summary = await CodeSessionService._summarize(session, older)
+            session.turns = json.dumps(turns)
+            metrics.incr("code_sessions.compactions")
+
+        messages = []
+        if session.summary:
+            messages.append({"role": "system", "content": f"Summary of the conversation so far:\n{session.summary}"})
+        return messages + turns
+
+    @staticmethod
+    async def _summarize(session: CodeSession, older: List[dict]) -> str:
+        previous = f"Earlier summary:\n{session.summary}\n\n" if session.summary else ""
+        transcript = "\n\n".join(f"{m['role'].upper()}:\n{m['content']}" for m in older)
+        return await OpenAIService.generate_text(
+            SUMMARY_PROMPT.format(language=session.language, previous=previous, transcript=transcript),
+            max_tokens=SUMMARY_MAX_TOKENS,
+            task="summarize",
+        )
+
+    @staticmethod
+    async def record_turn(session: CodeSession, prompt: str, reply: str):
+        """Append the exchange to the stored session, with any compaction done for this request.
+
+        The row is re-read under a lock (BEGIN IMMEDIATE on SQLite), so
+        concurrent follow-ups on one session each add their exchange rather
+        than overwrite each other's.
+        """
+        exchange = [{"role": "user", "content": prompt}, {"role": "assistant", "content": reply}]
+        async with AsyncWriteSessionLocal() as db:
+            stored = (await db.execute(
+                select(CodeSession).where(CodeSession.id == session.id).with_for_update()
+            )).scalar_one_or_none()
+            if stored is None:
+                # A new session (or one purged meanwhile)
+                session.turns = json.dumps(json.loads(session.turns or "[]") + exchange)
+                session.updated_at = datetime.utcnow()
+                await db.merge(session)
+            else:
+                turns = json.loads(stored.turns or "[]")
+                replaced, folded = getattr(session, "_compacted", (None, 0))
+                # Skip our compaction if another request compacted first; its summary covers the same turns
+                if folded and stored.summary == replaced:
+                    stored.summary = session.summary
+                    turns = turns[folded:]
+                stored.turns = json.dumps(turns + exchange)
+                stored.updated_at = datetime.utcnow()
+            await db.commit()
+
+    @staticmethod
+    async def purge_expired() -> int:
+        """Delete sessions idle for longer than the TTL"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(CodeSession).where(CodeSession.updated_at < datetime.utcnow() - CODE_SESSION_TTL)
+            )
+            await db.commit()
+        return result.rowcount
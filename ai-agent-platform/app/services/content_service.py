@@ -0,0 +1,142 @@
+import base64
+import re
+from datetime import datetime
+from sqlalchemy import DateTime, insert, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.request_context import get_request_context
+from app.db.database import AsyncSessionLocal
+from app.models.models import UserContent
+from app.services.write_behind import WriteBehindBuffer
+from app.core.config import settings
+
+
+CONTENT_FLUSH_INTERVAL = settings.content_flush_interval
+CONTENT_FLUSH_BATCH = settings.content_flush_batch
+# Only this much of each output is stored for search
+CONTENT_OUTPUT_TEXT_MAX = settings.content_output_text_max
+
+
+async def _write_contents(rows):
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(UserContent), rows)
+        await db.commit()
+
+
+content_buffer = WriteBehindBuffer(
+    "user_contents", _write_contents, max_batch=CONTENT_FLUSH_BATCH, flush_interval=CONTENT_FLUSH_INTERVAL
+)
+
+
+def record_content(content_type, file_path, prompt, output_text=None):
+    """Queue a generated artifact for the caller's history; anonymous callers are not recorded"""
+    ctx = get_request_context()
+    if ctx is None or ctx.user_id is None:
+        return
+    content_buffer.add({
+        "user_id": ctx.user_id,
+        "content_type": content_type,
+        "file_path": file_path,
+        "prompt": prompt,
+        "output_text": output_text[:CONTENT_OUTPUT_TEXT_MAX] if output_text else None,
+        # Stamped now so history order follows generation order, not flush order
+        "created_at": datetime.utcnow(),
+    })
+
+
+def encode_cursor(created_at: datetime, content_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{content_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, content_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(content_id)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+async def list_contents(db: AsyncSession, user_id: int, limit: int = 20, cursor: str = None):
+    """One page of a user's history, newest first.
+
+    Keyset pagination on (created_at, id) within the user, served by the
+    (user_id, created_at, id) index: every page is an index seek plus
+    ``limit`` rows, however deep the user pages. Returns (rows, next cursor).
+    """
+    query = (
+        select(UserContent.id, UserContent.content_type, UserContent.file_path,
+               UserContent.prompt, UserContent.created_at)
+        .where(UserContent.user_id == user_id)
+        .order_by(UserContent.created_at.desc(), UserContent.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        query = query.where(tuple_(UserContent.created_at, UserContent.id) < tuple_(*decode_cursor(cursor)))
+
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+_SQLITE_SEARCH = text("""
+    SELECT c.id, c.content_type, c.file_path, c.prompt, c.created_at,
+           snippet(user_contents_fts, -1, '[', ']', '...', 12) AS snippet,
+           -bm25(user_contents_fts, 2.0, 1.0) AS score
+    FROM user_contents_fts
+    JOIN user_contents c ON c.id = user_contents_fts.rowid
+    WHERE user_contents_fts MATCH :query AND c.user_id = :user_id
+    ORDER BY score DESC, c.id DESC
+    LIMIT :limit OFFSET :offset
+""").columns(created_at=DateTime)
+
+_POSTGRES_SEARCH = text("""
+    SELECT c.id, c.content_type, c.file_path, c.prompt, c.created_at,
+           ts_headline('english', coalesce(c.output_text, c.prompt, ''), q,
+                       'StartSel=[, StopSel=], MaxWords=24, MinWords=8') AS snippet,
+           ts_rank_cd(c.search_vector, q) AS score
+    FROM user_contents c, websearch_to_tsquery('english', :query) q
+    WHERE c.user_id = :user_id AND c.search_vector @@ q
+    ORDER BY score DESC, c.id DESC
+    LIMIT :limit OFFSET :offset
+""").columns(created_at=DateTime)
+
+
+def _fts5_query(query: str):
+    """Turn free text into a safe FTS5 query: every word must match, the last one as a prefix"""
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+async def search_contents(db: AsyncSession, user_id: int, query: str, limit: int = 20, offset: int = 0):
+    """Ranked full-text search over a user's prompts and outputs.
+
+    Returns (rows, next offset or None). Rows carry a highlighted ``snippet``
+    and a ``score`` (higher is better).
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        statement, query = _SQLITE_SEARCH, _fts5_query(query)
+        if query is None:
+            return [], None
+    elif dialect == "postgresql":
+        statement = _POSTGRES_SEARCH
+    else:
+        raise NotImplementedError(f"Full-text search is not available on {dialect}")
+
+    result = await db.execute(
+        statement, {"query": query, "user_id": user_id, "limit": limit + 1, "offset": offset}
+    )
+    rows = result.all()
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = offset + limit
+    return rows, next_offset
@@ -0,0 +1,109 @@
+"""Streaming text extraction from uploaded documents.
+
+Each reader yields the document's paragraphs one at a time, so a long file
+is never held in memory whole. docx and pptx are zip archives of XML parts:
+the parts are read straight from the archive and parsed with iterparse,
+clearing each paragraph once its text is out. Plain text and markdown are
+decoded in fixed-size chunks. All of this is blocking; iterate the readers
+on the I/O threads.
+"""
+import codecs
+import os
+import re
+import zipfile
+from xml.etree.ElementTree import ParseError, iterparse
+from fastapi import HTTPException
+
+CHUNK_SIZE = 64 * 1024
+# Text without blank lines is still handed on in pieces of about this size
+MAX_PARAGRAPH_CHARS = 16 * 1024
+FORMATS = {".docx": "docx", ".pptx": "pptx", ".txt": "text", ".md": "text", ".markdown": "text"}
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_SLIDE = re.compile(r"ppt/slides/slide(\d+)\.xml$")
+_BLANK_LINES = re.compile(r"\n\s*\n")
+
+
+class UnreadableDocument(HTTPException):
+    """400 for an upload that is not a readable docx, pptx, txt or markdown file"""
+
+    def __init__(self, detail):
+        super().__init__(status_code=400, detail=detail)
+
+
+def document_format(filename):
+    fmt = FORMATS.get(os.path.splitext(filename or "")[1].lower())
+    if fmt is None:
+        raise UnreadableDocument("Upload a .docx, .pptx, .txt or .md file")
+    return fmt
+
+
+def _xml_paragraphs(part, paragraph_tag, text_tag, container_depth):
+    """Text of each ``paragraph_tag`` element in an XML stream.
+
+    Finished elements at ``container_depth`` (children of the document body)
+    are dropped from the tree as the parse goes, which keeps memory flat.
+    """
+    depth, container = 0, None
+    for event, elem in iterparse(part, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == container_depth - 1:
+                container = elem
+            continue
+        if elem.tag == paragraph_tag:
+            text = "".join(t.text or "" for t in elem.iter(text_tag)).strip()
+            if text:
+                yield text
+            elem.clear()
+        if depth == container_depth and container is not None:
+            container.remove(elem)
+        depth -= 1
+
+
+def _docx_paragraphs(archive):
+    with archive.open("word/document.xml") as part:
+        # w:document > w:body > paragraphs and tables
+        yield from _xml_paragraphs(part, f"{_W}p", f"{_W}t", container_depth=3)
+
+
+def _pptx_paragraphs(archive):
+    slides = sorted(
+        (int(match.group(1)), name) for name in archive.namelist() if (match := _SLIDE.match(name))
+    )
+    for number, name in slides:
+        yield f"Slide {number}"
+        with archive.open(name) as part:
+            # p:sld > p:cSld > p:spTree > shapes
+            yield from _xml_paragraphs(part, f"{_A}p", f"{_A}t", container_depth=4)
+
+
+def _text_paragraphs(source):
+    """Paragraphs (split on blank lines) of a UTF-8 text file, decoded chunk by chunk"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+        pending += decoder.decode(chunk).replace("\r\n", "\n")
+        *done, pending = _BLANK_LINES.split(pending)
+        yield from (p.strip() for p in done if p.strip())
+        while len(pending) > MAX_PARAGRAPH_CHARS:
+            # Cut at the last space before the limit, if there is one
+            cut = pending.rfind(" ", 0, MAX_PARAGRAPH_CHARS) + 1 or MAX_PARAGRAPH_CHARS
+            yield pending[:cut].strip()
+            pending = pending[cut:]
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.strip()
+
+
+def read_paragraphs(source, fmt):
+    """Paragraphs of the document in the seekable binary file ``source``"""
+    if fmt == "text":
+        yield from _text_paragraphs(source)
+        return
+    try:
+        with zipfile.ZipFile(source) as archive:
+            yield from (_docx_paragraphs if fmt == "docx" else _pptx_paragraphs)(archive)
+    except (zipfile.BadZipFile, KeyError, ParseError):
+        raise UnreadableDocument(f"Not a readable .{fmt} file")
@@ -0,0 +1,135 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from cachetools import TTLCache
+from sqlalchemy import or_, select, update
+
+from app.core.metrics import metrics
+from app.db.database import AsyncSessionLocal
+from app.models.models import Subscription
+from app.core.config import settings
+
+
+ENTITLEMENT_CACHE_TTL = settings.entitlement_cache_ttl
+ENTITLEMENT_CACHE_SIZE = settings.entitlement_cache_size
+SUBSCRIPTION_SWEEP_INTERVAL = settings.subscription_sweep_interval
+
+# Plan assumed for users without an active subscription
+DEFAULT_PLAN = "free"
+
+
+@dataclass(frozen=True)
+class Entitlement:
+    user_id: int
+    plan_type: str
+    subscription_id: Optional[int] = None
+    expires_at: Optional[datetime] = None
+
+    def is_current(self, now):
+        return self.expires_at is None or self.expires_at > now
+
+
+# Per-process cache. Other workers only see an invalidation once their own
+# entry's TTL runs out, so ENTITLEMENT_CACHE_TTL bounds cross-worker staleness.
+_cache = TTLCache(maxsize=ENTITLEMENT_CACHE_SIZE, ttl=ENTITLEMENT_CACHE_TTL)
+_inflight = {}
+# Bumped on every invalidation so a load that raced with one is not cached
+_generation = 0
+
+
+class EntitlementService:
+    @staticmethod
+    async def get_entitlement(user_id: int) -> Entitlement:
+        """What the user is entitled to right now, served from the cache when possible"""
+        now = datetime.utcnow()
+        entitlement = _cache.get(user_id)
+        # A cached plan never outlives the subscription's own end date
+        if entitlement is not None and entitlement.is_current(now):
+            metrics.incr("entitlements.cache_hits")
+            return entitlement
+
+        metrics.incr("entitlements.cache_misses")
+        # Concurrent misses for the same user share one query
+        pending = _inflight.get(user_id)
+        if pending is None:
+            pending = asyncio.ensure_future(EntitlementService._load(user_id))
+            _inflight[user_id] = pending
+            pending.add_done_callback(lambda _: _inflight.pop(user_id, None))
+        return await asyncio.shield(pending)
+
+    @staticmethod
+    async def get_plan(user_id: int) -> str:
+        return (await EntitlementService.get_entitlement(user_id)).plan_type
+
+    @staticmethod
+    def invalidate(user_id: Optional[int] = None):
+        """Drop one user's cached entitlement, or all of them"""
+        global _generation
+        _generation += 1
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+    @staticmethod
+    async def _load(user_id: int) -> Entitlement:
+        now = datetime.utcnow()
+        generation = _generation
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Subscription.id, Subscription.plan_type, Subscription.end_date)
+                .where(
+                    Subscription.user_id == user_id,
+                    Subscription.is_active == True,
+                    or_(Subscription.end_date.is_(None), Subscription.end_date > now),
+                )
+                .limit(1)
+            )
+            row = result.first()
+
+        if row is None:
+            entitlement = Entitlement(user_id=user_id, plan_type=DEFAULT_PLAN)
+        else:
+            entitlement = Entitlement(
+                user_id=user_id,
+                plan_type=row.plan_type or DEFAULT_PLAN,
+                subscription_id=row.id,
+                expires_at=row.end_date,
+            )
+        if generation == _generation:
+            _cache[user_id] = entitlement
+        return entitlement
+
+    @staticmethod
+    async def expire_lapsed_subscriptions() -> int:
+        """Deactivate every active subscription past its end date in a single UPDATE"""
+        now = datetime.utcnow()
+        statement = (
+            update(Subscription)
+            .where(Subscription.is_active == True, Subscription.end_date < now)
+            .values(is_active=False)
+            .execution_options(synchronize_session=False)
+        )
+        async with AsyncSessionLocal() as db:
+            if db.bind.dialect.update_returning:
+                result = await db.execute(statement.returning(Subscription.user_id))
+                user_ids = result.scalars().all()
+                expired = len(user_ids)
+            else:
+                result = await db.execute(statement)
+                user_ids = None
+                expired = result.rowcount
+            await db.commit()
+
+        if expired:
+            if user_ids is None:
+                EntitlementService.invalidate()
+            else:
+                for user_id in user_ids:
+                    EntitlementService.invalidate(user_id)
+            metrics.incr("entitlements.subscriptions_expired", expired)
+        return expired
+
+
+metrics.register_gauge("entitlements.cache_size", lambda: len(_cache))
@@ -0,0 +1,158 @@
+"""Per-request model choice for chat completions.
+
+Each route (an endpoint, optionally narrowed to a task, e.g.
+``generate-code:debug``) lists the models good enough for it. For every call
+the router keeps the healthy candidates and drops those expected to be too
+slow. It then picks the one with the lowest estimated cost for the request.
+A model is unhealthy while its recent error rate is too high or its circuit
+breaker is open. Latency and errors are tracked per model from the calls
+themselves. Routes and prices can be overridden with ``MODEL_ROUTES`` and
+``MODEL_COSTS`` (JSON).
+"""
+import re
+import time
+from collections import deque
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.request_context import remaining_time
+from app.core.resilience import breaker_for
+
+# Acceptable models per route; a route without a task falls back to the endpoint's
+DEFAULT_ROUTES = {
+    "generate-presentation": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "generate-document": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "generate-code": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "generate-code:write": ["gpt-4o-mini", "gpt-4o"],
+    "generate-code:explain": ["gpt-4o-mini", "gpt-3.5-turbo"],
+    "generate-code:debug": ["gpt-4o"],
+    "generate-code:optimize": ["gpt-4o"],
+    "summarize-document": ["gpt-4o-mini", "gpt-3.5-turbo"],
+}
+DEFAULT_MODELS = ["gpt-3.5-turbo"]
+MODEL_ROUTES = {**DEFAULT_ROUTES, **settings.model_routes}
+
+# USD per million (input, output) tokens
+DEFAULT_MODEL_COSTS = {
+    "gpt-4o-mini": [0.15, 0.60],
+    "gpt-3.5-turbo": [0.50, 1.50],
+    "gpt-4o": [2.50, 10.00],
+}
+MODEL_COSTS = {**DEFAULT_MODEL_COSTS, **settings.model_costs}
+
+# A model is degraded when at least this share of its recent calls failed
+MODEL_MAX_ERROR_RATE = settings.model_max_error_rate
+MODEL_HEALTH_WINDOW = settings.model_health_window
+MODEL_MIN_SAMPLES = 5
+# Skip a model whose typical latency is this many times the fastest candidate's
+LATENCY_TOLERANCE = 2.0
+
+_TASK_PREFIX = re.compile(r"^\s*(write|debug|explain|optimize)\s+code\s*:", re.IGNORECASE)
+
+
+def task_from_prompt(prompt):
+    """The task named by a "Debug Code: ..." style prompt prefix, if any"""
+    match = _TASK_PREFIX.match(prompt)
+    return match.group(1).lower() if match else None
+
+
+class ModelHealth:
+    """Outcomes of one model's recent calls"""
+
+    def __init__(self, size=200):
+        self.calls = deque(maxlen=size)  # (monotonic time, ok, latency in seconds)
+
+    def record(self, ok, latency):
+        self.calls.append((time.monotonic(), ok, latency))
+
+    def _recent(self):
+        cutoff = time.monotonic() - MODEL_HEALTH_WINDOW
+        return [call for call in self.calls if call[0] >= cutoff]
+
+    def error_rate(self):
+        recent = self._recent()
+        if len(recent) < MODEL_MIN_SAMPLES:
+            return 0.0
+        return sum(1 for _, ok, _ in recent if not ok) / len(recent)
+
+    def typical_latency(self):
+        """Median latency of recent successful calls, or None without data"""
+        latencies = sorted(latency for _, ok, latency in self._recent() if ok)
+        return latencies[len(latencies) // 2] if latencies else None
+
+
+_health = {}
+
+
+def _health_for(model):
+    health = _health.get(model)
+    if health is None:
+        health = _health[model] = ModelHealth()
+    return health
+
+
+def circuit(operation, model):
+    """Circuit breaker name for ``operation`` on ``model``: models fail independently"""
+    return f"{operation}.{model}"
+
+
+def estimated_cost(model, prompt_tokens, max_tokens):
+    input_cost, output_cost = MODEL_COSTS.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_cost + max_tokens * output_cost) / 1_000_000
+
+
+def models_for(endpoint, task=None):
+    if task and f"{endpoint}:{task}" in MODEL_ROUTES:
+        return MODEL_ROUTES[f"{endpoint}:{task}"]
+    return MODEL_ROUTES.get(endpoint, DEFAULT_MODELS)
+
+
+def choose_model(operation, endpoint, task=None, prompt_tokens=0, max_tokens=0):
+    candidates = models_for(endpoint, task)
+    healthy = [
+        model for model in candidates
+        if breaker_for(circuit(operation, model)).state != "open"
+        and _health_for(model).error_rate() < MODEL_MAX_ERROR_RATE
+    ]
+    if not healthy:
+        # Everything is degraded: use the route's least failing model. Never leave the
+        # route: with every breaker open, take the one opened longest ago, whose
+        # breaker then answers 503 (or lets a trial call through once it half-opens)
+        closed = [m for m in candidates if breaker_for(circuit(operation, m)).state != "open"]
+        if closed:
+            healthy = [min(closed, key=lambda m: _health_for(m).error_rate())]
+        else:
+            healthy = [min(candidates, key=lambda m: breaker_for(circuit(operation, m)).opened_at)]
+        metrics.incr(f"models.degraded_route.{endpoint}")
+
+    latencies = {model: _health_for(model).typical_latency() for model in healthy}
+    known = [latency for latency in latencies.values() if latency is not None]
+    if known:
+        limit = min(known) * LATENCY_TOLERANCE
+        remaining = remaining_time()
+        if remaining is not None:
+            limit = min(limit, remaining)
+        fast_enough = [m for m in healthy if latencies[m] is None or latencies[m] <= limit]
+        healthy = fast_enough or [min(healthy, key=lambda m: latencies[m] if latencies[m] is not None else 0.0)]
+
+    # Cheapest first; equal costs keep the route's order
+    rank = {m: i for i, m in enumerate(candidates)}
+    model = min(healthy, key=lambda m: (estimated_cost(m, prompt_tokens, max_tokens), rank.get(m, len(rank))))
+    metrics.incr(f"models.routed.{endpoint}.{model}")
+    return model
+
+
+def record_outcome(model, ok, latency):
+    _health_for(model).record(ok, latency)
+    if not ok:
+        metrics.incr(f"models.failures.{model}")
+
+
+def model_health():
+    return {
+        model: {"error_rate": round(health.error_rate(), 3), "latency_s": health.typical_latency()}
+        for model, health in _health.items()
+    }
+
+
+metrics.register_gauge("models.health", model_health)
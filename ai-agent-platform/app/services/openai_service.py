@@ -1,57 +1,144 @@
-import os
-import openai
-from dotenv import load_dotenv
+import time
+from fastapi import HTTPException
+from app.core.admission import upstream_admission
+from app.core.lazy import LazyModule
+from app.core.metrics import metrics
+from app.core.request_context import check_deadline, get_request_context, remaining_time
+from app.core.resilience import call_upstream
+from app.services import model_router
+from app.services.prompt_cache import cache_key, get_cached, put_cached
+from app.services.token_budget import count_message_tokens, fit_output
+from app.services.usage_service import record_completion_usage, record_usage
+from app.core.config import settings
 
-load_dotenv()
+# Imported on first use and configured with the API key
+openai_sdk = LazyModule("openai", configure=lambda openai: setattr(openai, "api_key", settings.openai_api_key))
 
-# Set OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+def _upstream_slot(operation):
+    """Admission slot for an upstream call, budgeted by the calling endpoint (and
+    never past the request's deadline) and fairly shared between callers according to their plan"""
+    ctx = get_request_context()
+    if ctx is None:
+        return upstream_admission.slot(operation)
+    check_deadline(operation)
+    budget = upstream_admission.budget_for(ctx.endpoint)
+    remaining = remaining_time()
+    if remaining is not None:
+        budget = min(budget, remaining)
+    return upstream_admission.slot(ctx.endpoint, budget=budget, flow=ctx.caller, plan=ctx.plan)
 
-class OpenAIService:
-    @staticmethod
-    async def generate_text(prompt, max_tokens=1000):
+def _reply(operation, response):
+    """The reply text, and whether it is complete"""
+    choice = response.choices[0]
+    # Cut off by max_tokens: the budget for this kind of request is too tight
+    truncated = getattr(choice, "finish_reason", None) == "length"
+    if truncated:
+        metrics.incr(f"tokens.truncated.{operation}")
+    return choice.message.content.strip(), not truncated
+
+def _synthesize(create, **kwargs):
+    # Reading the body is part of the call: a dropped stream is retried too
+    return create(**kwargs).read()
+
+async def _chat(operation, usage_operation, messages, max_tokens, task=None):
+    """One chat completion on the model routed for this endpoint and task,
+    unless a near-duplicate prompt's answer is cached"""
+    ctx = get_request_context()
+    endpoint = ctx.endpoint if ctx else operation
+    # Only single-turn requests are cached: with history the answer depends on more than the prompt
+    key = None if len(messages) > 2 else await cache_key(operation, endpoint, task, messages[0]["content"], messages[-1]["content"])
+    cached = get_cached(key)
+    if cached is not None:
+        return cached
+    async with _upstream_slot(operation):
+        openai = await openai_sdk.load()
+        model = model_router.choose_model(
+            operation, endpoint, task,
+            prompt_tokens=count_message_tokens(messages), max_tokens=max_tokens
+        )
+        started = time.perf_counter()
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=max_tokens
+            response = await call_upstream(
+                operation,
+                openai.ChatCompletion.create,
+                # The SDK gives up on the HTTP call when the request's deadline passes
+                timeout_kwarg="request_timeout",
+                circuit=model_router.circuit(operation, model),
+                model=model,
+                messages=messages,
+                max_tokens=fit_output(messages, max_tokens, model)
             )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"OpenAI API error: {str(e)}")
-            return f"Error generating text: {str(e)}"
+        except HTTPException as e:
+            # Upstream failures and timeouts count against the model; refusals and overload do not
+            if e.status_code in (502, 504):
+                model_router.record_outcome(model, False, time.perf_counter() - started)
+            raise
+        latency = time.perf_counter() - started
+        model_router.record_outcome(model, True, latency)
+        record_completion_usage(usage_operation, model, response, latency * 1000)
+    reply, complete = _reply(operation, response)
+    if complete:
+        put_cached(key, reply)
+    return reply
+
+class OpenAIService:
+    # The openai SDK calls are synchronous, so they run on the shared I/O threads.
+    # Every call first takes an upstream slot, then goes through call_upstream
+    # (retries, circuit breaker, optional hedging). Failures raise HTTPExceptions
+    # (Overloaded, UpstreamError, DeadlineExceeded) instead of returning error text.
+    # Chat completions use the model the router picks for the endpoint and task.
+    # Successful calls are recorded in the usage ledger.
+    @staticmethod
+    async def generate_text(prompt, max_tokens=1000, task=None):
+        messages = [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt}
+        ]
+        return await _chat("generate_text", "text", messages, max_tokens, task)
     
     @staticmethod
     async def generate_image(prompt, size="512x512"):
-        try:
-            response = openai.Image.create(
+        async with _upstream_slot("generate_image"):
+            openai = await openai_sdk.load()
+            started = time.perf_counter()
+            response = await call_upstream(
+                "generate_image",
+                openai.Image.create,
+                timeout_kwarg="request_timeout",
                 prompt=prompt,
                 n=1,
                 size=size
             )
             image_url = response['data'][0]['url']
+            record_usage("image", "dall-e", (time.perf_counter() - started) * 1000, images=1)
             return image_url
-        except Exception as e:
-            print(f"OpenAI API error: {str(e)}")
-            return None
     
     @staticmethod
-    async def generate_code(prompt, language="python"):
-        system_message = f"You are an expert {language} programmer. Provide only code without explanation."
-        
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=2000
+    async def generate_code(prompt, language="python", max_tokens=2000, task=None, history=None):
+        """``history``: earlier messages of a code session, sent between the system message and ``prompt``"""
+        messages = [
+            {"role": "system", "content": f"You are an expert {language} programmer. Provide only code without explanation."},
+            *(history or []),
+            {"role": "user", "content": prompt}
+        ]
+        return await _chat("generate_code", "code", messages, max_tokens, task or model_router.task_from_prompt(prompt))
+    
+    @staticmethod
+    async def text_to_speech(text, voice="alloy"):
+        """Synthesize speech with OpenAI's TTS API and return the MP3 bytes"""
+        async with _upstream_slot("text_to_speech"):
+            openai = await openai_sdk.load()
+            # Looked up outside call_upstream: an SDK without the speech API is not an upstream failure
+            create = openai.audio.speech.create
+            started = time.perf_counter()
+            audio = await call_upstream(
+                "text_to_speech",
+                _synthesize,
+                timeout_kwarg="timeout",
+                create=create,
+                model="tts-1",
+                voice=voice,
+                input=text
             )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            print(f"OpenAI API error: {str(e)}")
-            return f"Error generating code: {str(e)}"
+            record_usage("tts", "tts-1", (time.perf_counter() - started) * 1000, tts_characters=len(text))
+            return audio
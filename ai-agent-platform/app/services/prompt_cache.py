@@ -0,0 +1,189 @@
+"""Near-duplicate prompt cache for chat completions.
+
+Prompts that differ only in case, punctuation, filler words or word order
+("Python function for fibonacci" / "fibonacci function in python") should
+not each cost an upstream call. Every prompt is normalised into a set of
+word shingles. A MinHash signature of that set is indexed with LSH banding,
+so a lookup compares against a handful of candidates instead of every
+entry. A candidate is a hit when the Jaccard similarity of the two shingle
+sets reaches the endpoint's threshold.
+
+Everything except the prompt's wording must match exactly: the operation,
+endpoint, task, system message and any numbers in the prompt ("5-slide"
+and "7-slide" never share an entry). The cache is off unless
+``PROMPT_CACHE_ENABLED`` is set, and it lives in process memory.
+"""
+import random
+import re
+import time
+import zlib
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.core.executors import run_blocking
+from app.core.metrics import metrics
+
+PROMPT_CACHE_ENABLED = settings.prompt_cache_enabled
+PROMPT_CACHE_SIZE = settings.prompt_cache_size
+PROMPT_CACHE_TTL = settings.prompt_cache_ttl
+# Minimum Jaccard similarity of the shingle sets for a hit, per endpoint
+DEFAULT_THRESHOLDS = {
+    "generate-code": 0.9,
+    "generate-document": 0.8,
+    "generate-presentation": 0.8,
+}
+DEFAULT_THRESHOLD = 0.9
+THRESHOLDS = {**DEFAULT_THRESHOLDS, **settings.prompt_cache_thresholds}
+
+# 16 bands of 4 rows: pairs from about 0.5 similarity up become candidates
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Long prompts are sketched from a consistent sample of their shingles
+MAX_SHINGLES = 256
+# Longer prompts are sketched on the I/O threads rather than the event loop
+INLINE_SKETCH_CHARS = 2000
+_PRIME = 4294967311  # smallest prime above 2**32
+_rng = random.Random(20240229)  # fixed, so signatures are the same in every worker
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_WORD = re.compile(r"[a-z0-9+#]+")
+_CLAUSE = re.compile(r"[.:;!?\n]+")
+_NUMBER = re.compile(r"\d+")
+# Dropped before shingling; negations are kept since they change the meaning
+STOPWORDS = frozenset(
+    "a an the in on of for to with and or by from at as is are be that this it me my please "
+    "can could would you write create make give".split()
+)
+
+
+def normalise(prompt):
+    """Clauses of ``prompt`` as lists of lowercased content words, without punctuation or filler words"""
+    clauses = (_WORD.findall(clause) for clause in _CLAUSE.split(prompt.lower()))
+    return [words for words in ([w for w in clause if w not in STOPWORDS] for clause in clauses) if words]
+
+
+def shingles(prompt):
+    """Hashed shingles: each word, plus each pair of neighbouring words in a clause, in either order"""
+    items = set()
+    for words in normalise(prompt):
+        items.update(words)
+        items.update(" ".join(sorted(pair)) for pair in zip(words, words[1:]))
+    hashes = {zlib.crc32(item.encode()) for item in items}
+    if len(hashes) > MAX_SHINGLES:
+        # The same smallest hashes are picked from any prompt, which keeps the estimate unbiased
+        hashes = set(sorted(hashes)[:MAX_SHINGLES])
+    return frozenset(hashes)
+
+
+def signature(hashes):
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def sketch(prompt):
+    """(shingle hashes, LSH band keys) of ``prompt``; empty for prompts without content words"""
+    hashes = shingles(prompt)
+    if not hashes:
+        return hashes, []
+    sig = signature(hashes)
+    return hashes, [(i, sig[i * ROWS:(i + 1) * ROWS]) for i in range(BANDS)]
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateCache:
+    """LRU store of completions, indexed by MinHash LSH bands per namespace"""
+
+    def __init__(self, max_entries=PROMPT_CACHE_SIZE, ttl=PROMPT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> (namespace, shingles, bands, output, expires)
+        self._buckets = {}  # (namespace, band) -> set of ids
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, namespace, sketched, threshold):
+        """(output, similarity) of the closest cached prompt at or above ``threshold``, or None"""
+        hashes, bands = sketched
+        candidates = set()
+        for band in bands:
+            candidates.update(self._buckets.get((namespace, band), ()))
+
+        now = time.monotonic()
+        best, best_score = None, threshold
+        for entry_id in candidates:
+            _, cached, _, output, expires = self._entries[entry_id]
+            if expires <= now:
+                self._remove(entry_id)
+                continue
+            score = jaccard(hashes, cached)
+            if score >= best_score:
+                best, best_score = entry_id, score
+        if best is None:
+            return None
+        self._entries.move_to_end(best)
+        return self._entries[best][3], best_score
+
+    def add(self, namespace, sketched, output):
+        hashes, bands = sketched
+        if not hashes:
+            return
+        bands = [(namespace, band) for band in bands]
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (namespace, hashes, bands, output, time.monotonic() + self.ttl)
+        for key in bands:
+            self._buckets.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id):
+        _, _, bands, _, _ = self._entries.pop(entry_id)
+        for key in bands:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+
+prompt_cache = NearDuplicateCache()
+
+
+async def cache_key(operation, endpoint, task, system, prompt):
+    """What get_cached and put_cached look up for ``prompt``; None while the cache is off"""
+    if not PROMPT_CACHE_ENABLED:
+        return None
+    namespace = (operation, endpoint, task, system, tuple(_NUMBER.findall(prompt)))
+    sketched = sketch(prompt) if len(prompt) <= INLINE_SKETCH_CHARS else await run_blocking(sketch, prompt)
+    return endpoint, namespace, sketched
+
+
+def get_cached(key):
+    """Cached output for a near-duplicate of the key's prompt, or None; hits and misses are counted per endpoint"""
+    if key is None:
+        return None
+    endpoint, namespace, sketched = key
+    found = prompt_cache.lookup(namespace, sketched, THRESHOLDS.get(endpoint, DEFAULT_THRESHOLD))
+    if found is None:
+        metrics.incr(f"prompt_cache.misses.{endpoint}")
+        return None
+    output, similarity = found
+    metrics.incr(f"prompt_cache.hits.{endpoint}")
+    metrics.observe(f"prompt_cache.hit_similarity.{endpoint}", similarity)
+    return output
+
+
+def put_cached(key, output):
+    if key is not None:
+        _, namespace, sketched = key
+        prompt_cache.add(namespace, sketched, output)
+
+
+metrics.register_gauge("prompt_cache.entries", lambda: len(prompt_cache))
@@ -0,0 +1,168 @@
+"""Blocking render and file-write helpers.
+
+These run on the shared executors (see app.core.executors), never directly on
+the event loop. They are plain module-level functions taking plain data so they
+can also be shipped to a process pool. python-docx and python-pptx are
+imported inside the functions that need them, keeping them out of startup.
+"""
+
+# Presentation templates: title slide layout first, content slide layout second
+PRESENTATION_TEMPLATES = {
+    # Blue professional template
+    "professional": [
+        {"layout_idx": 0, "bg_color": (0, 65, 120), "text_color": (255, 255, 255)},  # Title slide
+        {"layout_idx": 1, "bg_color": (240, 240, 240), "text_color": (0, 65, 120)}   # Content slide
+    ],
+    # Creative colorful template
+    "creative": [
+        {"layout_idx": 0, "bg_color": (110, 43, 98), "text_color": (255, 255, 255)},  # Title slide
+        {"layout_idx": 1, "bg_color": (250, 240, 250), "text_color": (110, 43, 98)}   # Content slide
+    ],
+    # Minimal white template
+    "minimal": [
+        {"layout_idx": 0, "bg_color": (255, 255, 255), "text_color": (80, 80, 80)},  # Title slide
+        {"layout_idx": 1, "bg_color": (255, 255, 255), "text_color": (80, 80, 80)}   # Content slide
+    ],
+}
+
+# Default template
+DEFAULT_TEMPLATE = [
+    {"layout_idx": 0, "bg_color": None, "text_color": None},  # Title slide
+    {"layout_idx": 1, "bg_color": None, "text_color": None}   # Content slide
+]
+
+
+def warm_up():
+    """Import the document libraries and load their default templates once,
+    so the first render does not pay for it"""
+    import pptx
+    from docx import Document
+
+    pptx.Presentation()
+    Document()
+    return True
+
+
+def write_text(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+
+def write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def render_document(content, path):
+    """Render markdown-ish text into a Word document saved at ``path``"""
+    from docx import Document
+
+    doc = Document()
+    doc.add_heading('Generated Document', 0)
+
+    # Add the content
+    paragraphs = content.split('\n\n')
+    for para in paragraphs:
+        if para.strip():
+            if para.startswith('# '):
+                doc.add_heading(para[2:], level=1)
+            elif para.startswith('## '):
+                doc.add_heading(para[3:], level=2)
+            elif para.startswith('### '):
+                doc.add_heading(para[4:], level=3)
+            else:
+                doc.add_paragraph(para)
+
+    doc.save(path)
+    return path
+
+
+def render_presentation(structure, template, path):
+    """Render a 'Slide N: Title / - bullet' outline into a PowerPoint deck saved at ``path``"""
+    import pptx
+    from pptx.util import Inches
+
+    prs = pptx.Presentation()
+    slide_layouts = PRESENTATION_TEMPLATES.get(template, DEFAULT_TEMPLATE)
+
+    # Parse the structure and create slides
+    current_slide = None
+    slide_count = 0
+
+    for line in structure.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith('Slide ') and ':' in line:
+            # New slide
+            slide_count += 1
+            title = line.split(':', 1)[1].strip()
+
+            # Select layout (alternate between title and content layouts)
+            layout_info = slide_layouts[0] if slide_count == 1 else slide_layouts[1]
+
+            slide_layout = prs.slide_layouts[layout_info["layout_idx"]]
+            current_slide = prs.slides.add_slide(slide_layout)
+
+            # Apply background color if specified
+            if layout_info["bg_color"]:
+                background = current_slide.background
+                fill = background.fill
+                fill.solid()
+                fill.fore_color.rgb = pptx.dml.color.RGBColor(*layout_info["bg_color"])
+
+            # Set title and apply text color if specified
+            title_shape = current_slide.shapes.title
+            title_shape.text = title
+
+            if layout_info["text_color"]:
+                for paragraph in title_shape.text_frame.paragraphs:
+                    for run in paragraph.runs:
+                        run.font.color.rgb = pptx.dml.color.RGBColor(*layout_info["text_color"])
+
+            # Get content placeholder if it exists
+            if slide_count > 1:  # Not the title slide
+                for shape in current_slide.placeholders:
+                    if shape.placeholder_format.type == 1:  # Content placeholder
+                        current_content = shape
+                        break
+                else:
+                    # If no content placeholder, add a textbox
+                    left = Inches(1)
+                    top = Inches(2)
+                    width = Inches(8)
+                    height = Inches(4)
+                    current_content = current_slide.shapes.add_textbox(left, top, width, height)
+
+                content_text = current_content.text_frame
+
+        elif line.startswith('- ') and current_slide and slide_count > 1:
+            # Bullet point for content slides
+            p = content_text.add_paragraph()
+            p.text = line[2:].strip()
+            p.level = 0
+
+            # Apply text color if specified
+            if slide_layouts[1]["text_color"]:
+                for run in p.runs:
+                    run.font.color.rgb = pptx.dml.color.RGBColor(*slide_layouts[1]["text_color"])
+
+    prs.save(path)
+    return path
+
+
+def render_silent_audio(path, duration_ms=3000):
+    """Write a silent MP3 placeholder; falls back to a bare MP3 header without pydub"""
+    try:
+        from pydub import AudioSegment
+
+        silence = AudioSegment.silent(duration=duration_ms)
+        silence.export(path, format="mp3")
+        return True
+    except ImportError:
+        # Just write minimal MP3 header bytes
+        write_bytes(path, b"\xFF\xFB\x90\x44\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00")
+        return False
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+
+from app.core.metrics import metrics
+from app.db.database import AsyncWriteSessionLocal, dialect_insert
+from app.models.models import StripeEvent, Subscription
+from app.services.account_service import AccountService
+from app.services.entitlement_service import EntitlementService
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+STRIPE_EVENT_BATCH_SIZE = settings.stripe_event_batch_size
+STRIPE_EVENT_POLL_INTERVAL = settings.stripe_event_poll_interval
+STRIPE_EVENT_MAX_ATTEMPTS = settings.stripe_event_max_attempts
+
+# Stripe subscription statuses that still grant access
+ACTIVE_STATUSES = {"active", "trialing", "past_due"}
+
+
+def _timestamp(value):
+    return datetime.utcfromtimestamp(value) if value else None
+
+
+async def record_event(db, event_id, event_type, payload):
+    """Store a verified event in the inbox; returns False if it was already there"""
+    insert = dialect_insert(db.bind.dialect.name)
+    result = await db.execute(
+        insert(StripeEvent)
+        .values(id=event_id, type=event_type, payload=payload, received_at=datetime.utcnow(), attempts=0)
+        .on_conflict_do_nothing(index_elements=["id"])
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def _find_by_stripe_id(db, stripe_subscription_id):
+    if not stripe_subscription_id:
+        return None
+    result = await db.execute(
+        select(Subscription)
+        .where(Subscription.stripe_subscription_id == stripe_subscription_id)
+        .order_by(Subscription.id.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+
+async def _deactivate_others(db, user_id, keep_id=None):
+    """Make room under the one-active-subscription index before activating a row"""
+    statement = update(Subscription).where(Subscription.user_id == user_id, Subscription.is_active == True)
+    if keep_id is not None:
+        statement = statement.where(Subscription.id != keep_id)
+    await db.execute(statement.values(is_active=False).execution_options(synchronize_session="fetch"))
+
+
+async def _checkout_completed(db, obj):
+    client_reference_id = obj.get("client_reference_id")
+    if not client_reference_id:
+        raise ValueError("No client reference ID found")
+    user_id = int(client_reference_id)
+    plan_type = (obj.get("metadata") or {}).get("plan_type", "premium")
+
+    result = await db.execute(select(Subscription).where(
+        Subscription.user_id == user_id,
+        Subscription.is_active == True
+    ))
+    subscription = result.scalars().first()
+    if subscription is None:
+        subscription = Subscription(user_id=user_id, is_active=True, start_date=datetime.utcnow())
+        db.add(subscription)
+
+    subscription.plan_type = plan_type
+    subscription.stripe_customer_id = obj.get("customer")
+    subscription.stripe_subscription_id = obj.get("subscription")
+    # Set end date to 1 year from now until Stripe reports the billing period
+    subscription.end_date = datetime.utcnow() + timedelta(days=365)
+    return user_id
+
+
+async def _subscription_changed(db, obj):
+    """customer.subscription.updated / deleted: renewals, plan changes and cancellations"""
+    subscription = await _find_by_stripe_id(db, obj.get("id"))
+    if subscription is None:
+        return None
+
+    active = obj.get("status") in ACTIVE_STATUSES
+    if active and not subscription.is_active:
+        await _deactivate_others(db, subscription.user_id, keep_id=subscription.id)
+    subscription.is_active = active
+
+    if active:
+        # Cancelled at period end still runs until the paid period is over
+        subscription.end_date = _timestamp(obj.get("current_period_end")) or subscription.end_date
+    else:
+        subscription.end_date = _timestamp(obj.get("ended_at")) or datetime.utcnow()
+
+    plan_type = (obj.get("metadata") or {}).get("plan_type")
+    if plan_type:
+        subscription.plan_type = plan_type
+    return subscription.user_id
+
+
+async def _invoice_paid(db, obj):
+    """invoice.paid: a renewal extends the subscription to the end of the paid period"""
+    subscription = await _find_by_stripe_id(db, obj.get("subscription"))
+    if subscription is None:
+        return None
+
+    # Line items carry the newly paid period; the invoice's own period_end is the previous one
+    period_end = obj.get("period_end") or 0
+    for line in (obj.get("lines") or {}).get("data") or []:
+        period_end = max(period_end, (line.get("period") or {}).get("end") or 0)
+    new_end = _timestamp(period_end)
+    if new_end and (subscription.end_date is None or new_end > subscription.end_date):
+        subscription.end_date = new_end
+
+    if not subscription.is_active:
+        await _deactivate_others(db, subscription.user_id, keep_id=subscription.id)
+        subscription.is_active = True
+    return subscription.user_id
+
+
+async def _invoice_payment_failed(db, obj):
+    # Access continues while Stripe retries; customer.subscription.updated reports the outcome
+    metrics.incr("stripe.invoice_payment_failed")
+    return None
+
+
+EVENT_HANDLERS = {
+    "checkout.session.completed": _checkout_completed,
+    "customer.subscription.created": _subscription_changed,
+    "customer.subscription.updated": _subscription_changed,
+    "customer.subscription.deleted": _subscription_changed,
+    "invoice.paid": _invoice_paid,
+    "invoice.payment_failed": _invoice_payment_failed,
+}
+
+
+class StripeEventConsumer:
+    """Background consumer draining the stripe_events inbox in batches.
+
+    The webhook route only verifies and stores events, then wakes the
+    consumer. Each event is applied inside its own savepoint so one bad
+    event does not roll back the rest of the batch; failures are retried on
+    later passes up to STRIPE_EVENT_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, batch_size=STRIPE_EVENT_BATCH_SIZE, poll_interval=STRIPE_EVENT_POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="stripe_event_consumer")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                # Keep draining while whole batches go through cleanly
+                while await self.process_batch() >= self.batch_size:
+                    pass
+            except Exception:
+                metrics.incr("stripe.consumer_failures")
+                logger.exception("Stripe event consumer pass failed")
+
+    async def process_batch(self):
+        """Apply up to batch_size pending events; returns how many were applied"""
+        touched_users = set()
+        applied = 0
+        async with AsyncWriteSessionLocal() as db:
+            result = await db.execute(
+                select(StripeEvent)
+                .where(StripeEvent.processed_at.is_(None), StripeEvent.attempts < STRIPE_EVENT_MAX_ATTEMPTS)
+                .order_by(StripeEvent.received_at)
+                .limit(self.batch_size)
+                # Lets several workers consume concurrently on PostgreSQL; ignored by SQLite
+                .with_for_update(skip_locked=True)
+            )
+            events = result.scalars().all()
+
+            for event in events:
+                handler = EVENT_HANDLERS.get(event.type)
+                try:
+                    if handler is not None:
+                        async with db.begin_nested():
+                            user_id = await handler(db, json.loads(event.payload)["data"]["object"])
+                        if user_id is not None:
+                            touched_users.add(user_id)
+                    event.processed_at = datetime.utcnow()
+                    event.last_error = None
+                    applied += 1
+                    metrics.incr("stripe.events_processed" if handler else "stripe.events_ignored")
+                except Exception as e:
+                    event.attempts = (event.attempts or 0) + 1
+                    event.last_error = str(e)[:500]
+                    metrics.incr("stripe.events_failed")
+                    logger.warning("Stripe event %s (%s) failed: %s", event.id, event.type, e)
+
+            await db.commit()
+
+        for user_id in touched_users:
+            EntitlementService.invalidate(user_id)
+            AccountService.invalidate(user_id)
+        return applied
+
+
+stripe_event_consumer = StripeEventConsumer()
@@ -0,0 +1,164 @@
+"""Summaries of uploaded documents, map-reduce style.
+
+The document is read a paragraph at a time (see document_reader) and cut
+into chunks of ``SUMMARY_CHUNK_TOKENS``. A first pass only counts the
+chunks, so a document over ``SUMMARY_MAX_CHUNKS`` is refused before any
+upstream call. On the second pass each chunk is summarized as soon as it
+is read, up to ``SUMMARY_CONCURRENCY`` at once (map). The partial
+summaries are then merged in order, in groups that fit one prompt, level
+by level until one prompt holds them all (reduce). Wall-clock time grows
+with the number of levels rather than the number of chunks, and memory
+holds the chunks in flight plus the short partial summaries. Every map
+and merge call counts against the caller's rate limit.
+"""
+import asyncio
+import itertools
+
+from app.core.config import settings
+from app.core.executors import iterate_blocking, run_blocking
+from app.core.metrics import metrics
+from app.core.rate_limit import pace
+from app.core.request_context import get_request_context
+from app.services import document_reader, token_budget
+from app.services.document_reader import UnreadableDocument
+from app.services.openai_service import OpenAIService
+
+SUMMARY_CHUNK_TOKENS = settings.summary_chunk_tokens
+# Length of each partial summary; several must fit in one reduce prompt
+SUMMARY_PART_TOKENS = settings.summary_part_tokens
+SUMMARY_CONCURRENCY = settings.summary_concurrency
+SUMMARY_MAX_CHUNKS = settings.summary_max_chunks
+ENDPOINT = "summarize-document"
+
+MAP_PROMPT = (
+    "Summarize part {part} of a longer document. Keep the key facts, figures, names, "
+    "decisions and conclusions; leave out examples and repetition.{focus}\n\n{text}"
+)
+MERGE_PROMPT = (
+    "These are summaries of consecutive parts of one document. Merge them into a single "
+    "summary in the same order, removing overlap.{focus}\n\n{text}"
+)
+FINAL_PROMPT = "Write a summary of the following document{source}.{focus}\n\n{text}"
+
+
+def _focus(instructions):
+    return f" {instructions.strip()}" if instructions and instructions.strip() else ""
+
+
+def _chunks(source, fmt):
+    return token_budget.chunk_paragraphs(document_reader.read_paragraphs(source, fmt), SUMMARY_CHUNK_TOKENS)
+
+
+def _count_chunks(source, fmt):
+    """Chunks in the document, counting no further than one past the limit; rewinds ``source``.
+
+    Blocking: run it on the I/O threads.
+    """
+    chunks = _chunks(source, fmt)
+    try:
+        return sum(1 for _ in itertools.islice(chunks, SUMMARY_MAX_CHUNKS + 1))
+    finally:
+        chunks.close()
+        source.seek(0)
+
+
+async def _summarize_parts(chunks, instructions):
+    """Partial summary of every chunk, in order, started as chunks are read"""
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    ctx = get_request_context()
+    tasks = []
+
+    async def summarize(number, text):
+        try:
+            await pace(ctx, ENDPOINT)
+            return await OpenAIService.generate_text(
+                MAP_PROMPT.format(part=number, focus=_focus(instructions), text=text),
+                max_tokens=SUMMARY_PART_TOKENS,
+            )
+        finally:
+            semaphore.release()
+
+    try:
+        async for chunk in iterate_blocking(chunks):
+            # Reading waits while the map is saturated, so at most SUMMARY_CONCURRENCY chunks are held
+            await semaphore.acquire()
+            tasks.append(asyncio.ensure_future(summarize(len(tasks) + 1, chunk)))
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+def _groups(summaries, limit):
+    """Consecutive runs of summaries that fit ``limit`` tokens together (at least two per run)"""
+    group, size = [], 0
+    for summary in summaries:
+        tokens = token_budget.count_tokens(summary)
+        if len(group) >= 2 and size + tokens > limit:
+            yield group
+            group, size = [], 0
+        group.append(summary)
+        size += tokens
+    if group:
+        yield group
+
+
+async def _merge_level(summaries, instructions):
+    """One reduce level: each group of consecutive summaries merged into one, concurrently"""
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    ctx = get_request_context()
+
+    async def merge(group):
+        if len(group) == 1:
+            return group[0]
+        async with semaphore:
+            await pace(ctx, ENDPOINT)
+            return await OpenAIService.generate_text(
+                MERGE_PROMPT.format(focus=_focus(instructions), text="\n\n---\n\n".join(group)),
+                max_tokens=SUMMARY_PART_TOKENS,
+            )
+
+    tasks = [asyncio.ensure_future(merge(group)) for group in _groups(summaries, SUMMARY_CHUNK_TOKENS)]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def _final(text, instructions, name):
+    return await OpenAIService.generate_text(
+        FINAL_PROMPT.format(source=f" ({name})" if name else "", focus=_focus(instructions), text=text),
+        max_tokens=token_budget.document_budget(instructions or "summary"),
+    )
+
+
+async def summarize_document(source, fmt, instructions="", name=None):
+    """(summary, number of chunks) for the document in the seekable binary file ``source``"""
+    parts = await run_blocking(_count_chunks, source, fmt)
+    if not parts:
+        raise UnreadableDocument("The document has no text")
+    if parts > SUMMARY_MAX_CHUNKS:
+        raise UnreadableDocument(
+            f"Document too long: more than {SUMMARY_MAX_CHUNKS} parts of {SUMMARY_CHUNK_TOKENS} tokens"
+        )
+
+    chunks = _chunks(source, fmt)
+    try:
+        if parts == 1:
+            # Short enough for a single call
+            metrics.observe("summaries.chunks", 1)
+            return await _final(await run_blocking(next, chunks), instructions, name), 1
+
+        summaries = await _summarize_parts(chunks, instructions)
+        metrics.observe("summaries.chunks", len(summaries))
+        levels = 1
+        while len(summaries) > 1 and sum(token_budget.count_tokens(s) for s in summaries) > SUMMARY_CHUNK_TOKENS:
+            summaries = await _merge_level(summaries, instructions)
+            levels += 1
+        metrics.observe("summaries.reduce_levels", levels)
+        return await _final("\n\n---\n\n".join(summaries), instructions, name), parts
+    finally:
+        await run_blocking(chunks.close)
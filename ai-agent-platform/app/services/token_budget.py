@@ -0,0 +1,190 @@
+"""Local token counting and per-request output budgets.
+
+Counts use tiktoken when it is installed and a character/word heuristic
+otherwise, so nothing here needs the network or the upstream API. Budgets
+size ``max_tokens`` to what a request actually asks for (slide count,
+document type, language) instead of one fixed ceiling. Oversized inputs are
+trimmed before they are sent.
+"""
+import math
+import re
+from functools import lru_cache
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+MODEL_CONTEXT_TOKENS = {"gpt-3.5-turbo": 16385, "gpt-4o-mini": 128000, "gpt-4o": 128000}
+MAX_OUTPUT_TOKENS = settings.max_output_tokens
+MAX_INPUT_TOKENS = settings.max_input_tokens
+# Per-message framing tokens in the chat format, plus the reply's priming
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+# Output budgets, in tokens
+TOKENS_PER_SLIDE = 90  # a title and four or five bullets
+PRESENTATION_OVERHEAD = 60
+DEFAULT_DOCUMENT_BUDGET = 1200
+# The first entry with a keyword in the document type (whole words) decides the budget
+DOCUMENT_TYPE_BUDGETS = [
+    (("tweet", "headline", "slogan", "tagline"), 150),
+    (("email", "e-mail", "letter", "memo", "note", "message"), 500),
+    (("summary", "abstract", "outline", "bio", "description"), 600),
+    (("blog", "article", "essay", "post"), 1500),
+    (("report", "proposal", "whitepaper", "white paper", "guide", "manual", "documentation", "plan"), 2500),
+]
+DEFAULT_CODE_BUDGET = 1200
+CODE_BUDGETS = {
+    "sql": 600,
+    "css": 900,
+    "python": 1200,
+    "ruby": 1200,
+    "php": 1400,
+    "javascript": 1400,
+    "typescript": 1600,
+    "go": 1600,
+    "html": 1600,
+    "rust": 1800,
+    "swift": 1800,
+    "kotlin": 1800,
+    "c#": 1800,
+    "java": 2000,
+    "c++": 2000,
+}
+# Longer specifications get longer code, up to the ceiling
+CODE_TOKENS_PER_PROMPT_TOKEN = 4
+
+TOKENS_PER_WORD = 1.35
+WORDS_PER_PAGE = 500
+TOKENS_PER_PARAGRAPH = 120
+# "Write a {document type} about {topic}", as the writing tool phrases it
+_DOCUMENT_TYPE = re.compile(r"^\s*(?:write|create|draft|generate)\s+(?:an?\s+|the\s+)?(.+?)\s+(?:about|on|for)\b",
+                            re.IGNORECASE)
+_DOCUMENT_TYPE_PATTERNS = [
+    (re.compile(r"\b(?:%s)s?\b" % "|".join(re.escape(k) for k in keywords), re.IGNORECASE), budget)
+    for keywords, budget in DOCUMENT_TYPE_BUDGETS
+]
+_LENGTH_HINT = re.compile(r"(\d{1,5})\s*(?:-\s*)?(words?|pages?|paragraphs?)\b", re.IGNORECASE)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    """The model's tiktoken encoding, or None to use the heuristic"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # Unknown model, or the BPE file cannot be fetched
+        return None
+
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # About four characters per token for English prose; word-heavy text runs higher
+    return max(math.ceil(len(text) / 4), math.ceil(len(text.split()) * TOKENS_PER_WORD))
+
+
+def count_message_tokens(messages, model=DEFAULT_MODEL):
+    return sum(count_tokens(m["content"], model) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+
+def trim_to_tokens(text, limit, model=DEFAULT_MODEL):
+    """``text`` cut to at most ``limit`` tokens, keeping the beginning"""
+    count = count_tokens(text, model)
+    if count <= limit:
+        return text
+    encoding = _encoding(model)
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:limit])
+    cut = text[:int(len(text) * limit / count)]
+    # Do not end mid-word
+    return cut.rsplit(None, 1)[0] if " " in cut.strip() else cut
+
+
+def trim_input(text, endpoint, limit=None):
+    """User input cut down to the input budget, counting trims per endpoint"""
+    trimmed = trim_to_tokens(text, limit or MAX_INPUT_TOKENS)
+    if trimmed is not text:
+        metrics.incr(f"tokens.input_trimmed.{endpoint}")
+    return trimmed
+
+
+def chunk_paragraphs(paragraphs, limit, model=DEFAULT_MODEL):
+    """Join paragraphs into chunks of at most ``limit`` tokens, splitting any that are longer alone"""
+    chunk, size = [], 0
+    for paragraph in paragraphs:
+        tokens = count_tokens(paragraph, model)
+        if chunk and size + tokens > limit:
+            yield "\n\n".join(chunk)
+            chunk, size = [], 0
+        while tokens > limit:
+            head = trim_to_tokens(paragraph, limit, model) or paragraph[:limit * 4]
+            yield head
+            paragraph = paragraph[len(head):].lstrip()
+            tokens = count_tokens(paragraph, model)
+        if paragraph:
+            chunk.append(paragraph)
+            size += tokens
+    if chunk:
+        yield "\n\n".join(chunk)
+
+
+def _explicit_length(prompt):
+    """Output tokens for a length the prompt asks for ("about 300 words", "2 pages"), if any"""
+    match = _LENGTH_HINT.search(prompt)
+    if match is None:
+        return None
+    amount, unit = int(match.group(1)), match.group(2).lower()
+    if unit.startswith("word"):
+        return math.ceil(amount * TOKENS_PER_WORD)
+    if unit.startswith("page"):
+        return math.ceil(amount * WORDS_PER_PAGE * TOKENS_PER_WORD)
+    return amount * TOKENS_PER_PARAGRAPH
+
+
+def _bounded(tokens, endpoint):
+    tokens = max(1, min(int(tokens), MAX_OUTPUT_TOKENS))
+    metrics.observe(f"tokens.budget.{endpoint}", tokens)
+    return tokens
+
+
+def presentation_budget(slides):
+    return _bounded(PRESENTATION_OVERHEAD + max(1, slides) * TOKENS_PER_SLIDE, "generate-presentation")
+
+
+def document_budget(prompt):
+    tokens = _explicit_length(prompt)
+    if tokens is not None:
+        # Headroom for headings and a slightly long answer
+        tokens = math.ceil(tokens * 1.2)
+    else:
+        # Only the type is looked at, so the topic ("a report about notebook sales") cannot change it
+        match = _DOCUMENT_TYPE.match(prompt)
+        document_type = match.group(1) if match else prompt
+        tokens = next(
+            (budget for pattern, budget in _DOCUMENT_TYPE_PATTERNS if pattern.search(document_type)),
+            DEFAULT_DOCUMENT_BUDGET,
+        )
+    return _bounded(tokens, "generate-document")
+
+
+def code_budget(prompt, language):
+    base = CODE_BUDGETS.get(language.lower(), DEFAULT_CODE_BUDGET)
+    return _bounded(base + CODE_TOKENS_PER_PROMPT_TOKEN * count_tokens(prompt), "generate-code")
+
+
+def fit_output(messages, max_tokens, model=DEFAULT_MODEL):
+    """``max_tokens`` capped so prompt plus reply fit the model's context window"""
+    context = MODEL_CONTEXT_TOKENS.get(model, MODEL_CONTEXT_TOKENS[DEFAULT_MODEL])
+    return max(1, min(max_tokens, MAX_OUTPUT_TOKENS, context - count_message_tokens(messages, model)))
+
+
+def warm_up():
+    """Load the tokenizer (tiktoken may download its BPE file) before the first request"""
+    _encoding(DEFAULT_MODEL)
+    return True
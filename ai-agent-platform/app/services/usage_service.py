@@ -0,0 +1,124 @@
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, insert, literal, select
+
+from app.core.request_context import get_request_context
+from app.db.database import AsyncSessionLocal, AsyncWriteSessionLocal, dialect_insert
+from app.models.models import UsageDaily, UsageEvent
+from app.services.write_behind import WriteBehindBuffer
+from app.core.config import settings
+
+
+USAGE_FLUSH_INTERVAL = settings.usage_flush_interval
+USAGE_FLUSH_BATCH = settings.usage_flush_batch
+USAGE_ROLLUP_INTERVAL = settings.usage_rollup_interval
+# Yesterday keeps being re-rolled for this long after midnight to absorb late flushes
+USAGE_ROLLUP_GRACE = timedelta(minutes=settings.usage_rollup_grace_minutes)
+
+
+async def _write_usage_events(rows):
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(UsageEvent), rows)
+        await db.commit()
+
+
+usage_buffer = WriteBehindBuffer(
+    "usage_events", _write_usage_events, max_batch=USAGE_FLUSH_BATCH, flush_interval=USAGE_FLUSH_INTERVAL
+)
+
+
+def record_usage(operation, model=None, latency_ms=0.0, prompt_tokens=0, completion_tokens=0,
+                 images=0, tts_characters=0):
+    """Queue a usage event for the current caller; never blocks on the database"""
+    ctx = get_request_context()
+    usage_buffer.add({
+        "user_id": ctx.user_id if ctx else None,
+        "endpoint": ctx.endpoint if ctx else None,
+        "operation": operation,
+        "model": model,
+        "prompt_tokens": prompt_tokens or 0,
+        "completion_tokens": completion_tokens or 0,
+        "images": images,
+        "tts_characters": tts_characters,
+        "latency_ms": latency_ms,
+        "created_at": datetime.utcnow(),
+    })
+
+
+def record_completion_usage(operation, model, response, latency_ms):
+    """Usage from a chat completion response (works with dict and object responses)"""
+    usage = getattr(response, "usage", None)
+    if usage is None and isinstance(response, dict):
+        usage = response.get("usage")
+    if isinstance(usage, dict):
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens"), usage.get("completion_tokens")
+    else:
+        prompt_tokens = getattr(usage, "prompt_tokens", 0)
+        completion_tokens = getattr(usage, "completion_tokens", 0)
+    record_usage(operation, model, latency_ms, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+async def rollup_day(day: date):
+    """Recompute one day's usage_daily rows from usage_events.
+
+    Recomputing (rather than incrementing) keeps reruns and concurrent
+    workers idempotent.
+    """
+    start = datetime.combine(day, time.min)
+    aggregate = (
+        select(
+            UsageEvent.user_id,
+            literal(day, UsageDaily.day.type).label("day"),
+            UsageEvent.operation,
+            func.count().label("requests"),
+            func.coalesce(func.sum(UsageEvent.prompt_tokens), 0),
+            func.coalesce(func.sum(UsageEvent.completion_tokens), 0),
+            func.coalesce(func.sum(UsageEvent.images), 0),
+            func.coalesce(func.sum(UsageEvent.tts_characters), 0),
+            func.coalesce(func.sum(UsageEvent.latency_ms), 0),
+            literal(datetime.utcnow(), UsageDaily.updated_at.type),
+        )
+        .where(
+            UsageEvent.created_at >= start,
+            UsageEvent.created_at < start + timedelta(days=1),
+            UsageEvent.user_id.is_not(None),
+        )
+        .group_by(UsageEvent.user_id, UsageEvent.operation)
+    )
+    columns = ["user_id", "day", "operation", "requests", "prompt_tokens", "completion_tokens",
+               "images", "tts_characters", "latency_ms_total", "updated_at"]
+
+    async with AsyncWriteSessionLocal() as db:
+        upsert = dialect_insert(db.bind.dialect.name)(UsageDaily).from_select(columns, aggregate)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=["user_id", "day", "operation"],
+            set_={name: upsert.excluded[name] for name in columns[3:]},
+        )
+        await db.execute(upsert)
+        await db.commit()
+
+
+async def rollup_recent_usage():
+    """Periodic job: roll up today, and yesterday shortly after midnight"""
+    now = datetime.utcnow()
+    today = now.date()
+    if now - datetime.combine(today, time.min) < USAGE_ROLLUP_GRACE:
+        await rollup_day(today - timedelta(days=1))
+    await rollup_day(today)
+
+
+async def get_usage_totals(user_id: int, since: date):
+    """Pre-aggregated usage per operation since ``since`` (inclusive), for quota checks and dashboards"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(
+                UsageDaily.operation,
+                func.sum(UsageDaily.requests).label("requests"),
+                func.sum(UsageDaily.prompt_tokens).label("prompt_tokens"),
+                func.sum(UsageDaily.completion_tokens).label("completion_tokens"),
+                func.sum(UsageDaily.images).label("images"),
+                func.sum(UsageDaily.tts_characters).label("tts_characters"),
+            )
+            .where(UsageDaily.user_id == user_id, UsageDaily.day >= since)
+            .group_by(UsageDaily.operation)
+        )
+        return {row.operation: dict(row._mapping) for row in result}
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections import deque
+from sqlalchemy.exc import DisconnectionError, OperationalError
+
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Failures that say nothing about the rows themselves: retried as they are, indefinitely
+TRANSIENT_ERRORS = (OperationalError, DisconnectionError, OSError, asyncio.TimeoutError)
+
+
+class WriteBehindBuffer:
+    """Collects rows in memory and writes them in batches from a background task.
+
+    ``add`` never touches the database, so callers on the request path pay
+    for an append only. ``flush_func(rows)`` is awaited with up to
+    ``max_batch`` rows whenever a batch fills up or every ``flush_interval``
+    seconds. Rows from a failed flush go back to the front of the buffer; past
+    ``max_pending`` rows the oldest are dropped and counted.
+
+    A batch failing ``max_attempts`` times in a row for a reason other than
+    the database being unreachable (a constraint violation, bad data) is
+    split in half, down to single rows, and a single row that still fails
+    is logged and dropped as dead-lettered, so one bad row cannot block the
+    rows behind it.
+    """
+
+    def __init__(self, name, flush_func, max_batch=500, flush_interval=1.0, max_pending=50000, max_attempts=3):
+        self.name = name
+        self.flush_func = flush_func
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._rows = deque(maxlen=max_pending)
+        self._batch_size = max_batch
+        self._failures = 0
+        self._suspect = 0  # rows at the front still inside a batch being split
+        self._batch_ready = asyncio.Event()
+        self._task = None
+        metrics.register_gauge(f"write_behind.{name}.pending", lambda: len(self._rows))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, row):
+        if len(self._rows) == self._rows.maxlen:
+            metrics.incr(f"write_behind.{self.name}.dropped")
+        self._rows.append(row)
+        if len(self._rows) >= self.max_batch:
+            self._batch_ready.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name=f"write_behind_{self.name}")
+
+    async def stop(self):
+        """Stop the background task and write out whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._rows:
+            if not await self.flush():
+                break
+
+    async def flush(self):
+        """Write one batch; returns False if the write failed"""
+        if not self._rows:
+            return True
+        batch = [self._rows.popleft() for _ in range(min(self._batch_size, len(self._rows)))]
+        try:
+            await self.flush_func(batch)
+        except Exception as e:
+            metrics.incr(f"write_behind.{self.name}.flush_failures")
+            if isinstance(e, TRANSIENT_ERRORS):
+                logger.warning("Write-behind flush for %s failed (%s); %d rows requeued", self.name, e, len(batch))
+            else:
+                logger.exception("Write-behind flush for %s failed; %d rows requeued", self.name, len(batch))
+                self._failures += 1
+                if self._failures >= self.max_attempts:
+                    self._failures = 0
+                    if len(batch) == 1:
+                        metrics.incr(f"write_behind.{self.name}.dead_lettered")
+                        logger.error("Write-behind %s dead-lettered a row after %d failures: %r",
+                                     self.name, self.max_attempts, batch[0])
+                        self._passed(1)
+                        return False
+                    # Narrow down to the rows that fail
+                    self._suspect = self._suspect or len(batch)
+                    self._batch_size = max(1, len(batch) // 2)
+            self._requeue(batch)
+            return False
+        self._failures = 0
+        self._passed(len(batch))
+        metrics.incr(f"write_behind.{self.name}.flushed", len(batch))
+        metrics.incr(f"write_behind.{self.name}.batches")
+        return True
+
+    def _passed(self, count):
+        """``count`` rows left the front; back to full batches once the failing batch is cleared"""
+        self._suspect = max(0, self._suspect - count)
+        if not self._suspect:
+            self._batch_size = self.max_batch
+
+    def _requeue(self, batch):
+        """Put ``batch`` back in front; if that overfills the buffer, its oldest rows are dropped"""
+        overflow = len(batch) + len(self._rows) - self._rows.maxlen
+        if overflow > 0:
+            metrics.incr(f"write_behind.{self.name}.dropped", overflow)
+            batch = batch[overflow:]
+        self._rows.extendleft(reversed(batch))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            # Drain full batches back to back; a failure waits for the next tick
+            while self._rows and await self.flush() and len(self._rows) >= self.max_batch:
+                pass
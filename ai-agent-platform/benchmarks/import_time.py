@@ -0,0 +1,102 @@
+"""Cold-start benchmark: how long a fresh interpreter takes to import the app.
+
+Every run imports ``app.main`` (or ``--module``) in a new Python process, so
+nothing is cached in memory. One extra run with ``-X importtime`` lists the
+slowest imports, and the report flags heavy libraries that should only load
+lazily but were imported at startup.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 10 --json
+    python benchmarks/import_time.py --max-ms 800   # exit 1 when slower, e.g. in CI
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported by the app at startup
+LAZY_MODULES = ["pptx", "docx", "PIL", "requests", "stripe", "openai", "pydub", "tiktoken"]
+
+_TIMED_IMPORT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({{"ms": elapsed, "loaded": [name for name in {lazy!r} if name in sys.modules]}}))
+"""
+
+
+def _run(args):
+    result = subprocess.run(
+        [sys.executable, *args], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    )
+    return result
+
+
+def time_import(module):
+    """Milliseconds to import ``module`` in a fresh interpreter, plus the lazy modules it pulled in"""
+    result = _run(["-c", _TIMED_IMPORT.format(module=module, lazy=LAZY_MODULES)])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module, top):
+    """(cumulative ms, self ms, name) of the slowest imports, from ``-X importtime``"""
+    result = _run(["-X", "importtime", "-c", f"import {module}"])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us) / 1000, int(self_us) / 1000, name.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--json", action="store_true", help="print one JSON object instead of a report")
+    parser.add_argument("--max-ms", type=float, help="fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    runs = [time_import(args.module) for _ in range(args.runs)]
+    timings = sorted(run["ms"] for run in runs)
+    eager = runs[-1]["loaded"]
+    report = {
+        "module": args.module,
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "median_ms": round(statistics.median(timings), 1),
+        "min_ms": round(timings[0], 1),
+        "max_ms": round(timings[-1], 1),
+        "eager_heavy_modules": eager,
+        "slowest_imports": [
+            {"module": name.strip(), "cumulative_ms": round(cumulative, 1), "self_ms": round(self_ms, 1)}
+            for cumulative, self_ms, name in slowest_imports(args.module, args.top)
+        ],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import {report['module']} (Python {report['python']}, {args.runs} runs)")
+        print(f"  median {report['median_ms']} ms   min {report['min_ms']} ms   max {report['max_ms']} ms")
+        print(f"  heavy modules loaded eagerly: {', '.join(eager) or 'none'}")
+        print("\nSlowest imports (cumulative / self ms):")
+        for row in report["slowest_imports"]:
+            print(f"  {row['cumulative_ms']:9.1f} {row['self_ms']:9.1f}  {row['module']}")
+
+    if args.max_ms is not None and report["median_ms"] > args.max_ms:
+        print(f"Median import time {report['median_ms']} ms exceeds {args.max_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""Calls from the Streamlit pages to the API"""
+import hashlib
+import json
+import os
+import uuid
+
+import requests
+import streamlit as st
+from urllib3.filepost import encode_multipart_formdata
+
+# API endpoint - use environment variable in production
+API_URL = os.getenv("API_URL", "http://localhost:8000/api")
+
+
+def post_tool(endpoint, payload, upload=None):
+    """POST to an AI tool with an Idempotency-Key.
+
+    The key stays the same while the same input is resubmitted without an
+    answer (a double click, a rerun, a timeout), so the API replays the
+    first result instead of generating it again. It is dropped once an
+    answer arrives, so a later submission generates anew.
+
+    With ``upload`` (a Streamlit uploaded file) the payload goes as form
+    fields next to the file instead of as JSON.
+    """
+    fingerprint = json.dumps(payload, sort_keys=True)
+    if upload is not None:
+        fingerprint += hashlib.sha256(upload.getvalue()).hexdigest()
+    pending = st.session_state.setdefault("pending_requests", {})
+    if endpoint not in pending or pending[endpoint][0] != fingerprint:
+        pending[endpoint] = (fingerprint, str(uuid.uuid4()))
+    headers = {"Idempotency-Key": pending[endpoint][1]}
+    if st.session_state.get("token"):
+        headers["Authorization"] = f"Bearer {st.session_state.token}"
+    if upload is None:
+        response = requests.post(f"{API_URL}/tools/{endpoint}", json=payload, headers=headers)
+    else:
+        # A boundary taken from the key keeps a resubmitted body byte-identical, as the replay check needs
+        body, headers["Content-Type"] = encode_multipart_formdata(
+            {**payload, "file": (upload.name, upload.getvalue())}, boundary=pending[endpoint][1].replace("-", "")
+        )
+        response = requests.post(f"{API_URL}/tools/{endpoint}", data=body, headers=headers)
+    if response.status_code != 409:  # 409: the first submission is still running
+        pending.pop(endpoint, None)
+    return response
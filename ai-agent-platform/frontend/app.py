@@ -1,13 +1,11 @@
 import streamlit as st
 import requests
-import json
 import os
-import base64
 from PIL import Image
 from io import BytesIO
+from api import API_URL, post_tool
+from widgets import download_button, code_followup
 
-# API endpoint - use environment variable in production
-API_URL = os.getenv("API_URL", "http://localhost:8000/api")
 
 # Configure page
 st.set_page_config(
@@ -55,22 +53,25 @@ if "token" not in st.session_state:
     st.session_state.token = None
 if "user_id" not in st.session_state:
     st.session_state.user_id = None
+if "profile" not in st.session_state:
+    st.session_state.profile = None
 if "current_tool" not in st.session_state:
     st.session_state.current_tool = "Home"
 
 # Helper functions
-def download_button(file_path, button_text, file_name):
-    """Create a download button for a file"""
+def load_profile():
+    """Fetch the account summary (plan, usage, history count) and remember it for the session"""
     try:
-        with open(file_path, "rb") as file:
-            contents = file.read()
-        
-        b64 = base64.b64encode(contents).decode()
-        href = f'data:application/octet-stream;base64,{b64}'
-        return st.markdown(f'<a href="{href}" download="{file_name}" class="st-emotion-cache-1nf528h e1f1d6gn0">⬇️ {button_text}</a>', unsafe_allow_html=True)
-    except Exception as e:
-        st.error(f"Error creating download button: {str(e)}")
-        return None
+        response = requests.get(
+            f"{API_URL}/me",
+            headers={"Authorization": f"Bearer {st.session_state.token}"}
+        )
+        if response.status_code == 200:
+            st.session_state.profile = response.json()
+            st.session_state.user_id = st.session_state.profile["id"]
+    except Exception:
+        # Leave it unset; the next rerun tries again
+        st.session_state.profile = None
 
 def switch_tool(tool_name):
     """Switch to a different tool"""
@@ -147,6 +148,7 @@ else:
         st.session_state.username = None
         st.session_state.token = None
         st.session_state.user_id = None
+        st.session_state.profile = None
         st.rerun()
     
     # Tool selection
@@ -161,8 +163,27 @@ else:
     st.sidebar.divider()
     st.sidebar.subheader("Subscription")
     
-    subscription_status = "Free Trial"
-    st.sidebar.info(f"Current Plan: {subscription_status}")
+    # Fetched once per session, not on every rerun
+    if st.session_state.profile is None:
+        load_profile()
+    profile = st.session_state.profile
+    
+    if profile:
+        st.sidebar.info(f"Current Plan: {profile['plan'].title()}")
+        subscription = profile.get("subscription")
+        if subscription and subscription.get("end_date"):
+            st.sidebar.caption(f"Renews or ends on {subscription['end_date'][:10]}")
+        usage = profile["usage"]
+        st.sidebar.caption(
+            f"This month: {usage['requests']} requests, "
+            f"{usage['prompt_tokens'] + usage['completion_tokens']} tokens, "
+            f"{profile['content_count']} items in your history"
+        )
+        if st.sidebar.button("Refresh account info"):
+            load_profile()
+            st.rerun()
+    else:
+        st.sidebar.warning("Could not load your account details")
     
     if st.sidebar.button("Upgrade to Premium", type="primary"):
         # In a complete implementation, this would redirect to a checkout page
@@ -281,12 +302,7 @@ else:
         if submit and prompt:
             with st.spinner("Generating your image..."):
                 try:
-                    headers = {"Authorization": f"Bearer {st.session_state.token}"} if st.session_state.token else {}
-                    response = requests.post(
-                        f"{API_URL}/tools/generate-image",
-                        params={"prompt": prompt, "style": style.lower()},
-                        headers=headers
-                    )
+                    response = post_tool("generate-image", {"prompt": prompt, "style": style.lower()})
                     
                     if response.status_code == 200:
                         result = response.json()
@@ -332,17 +348,18 @@ else:
         if submit and prompt:
             with st.spinner("Generating your code..."):
                 try:
-                    headers = {"Authorization": f"Bearer {st.session_state.token}"} if st.session_state.token else {}
-                    response = requests.post(
-                        f"{API_URL}/tools/generate-code",
-                        params={"prompt": f"{task}: {prompt}", "language": language.lower()},
-                        headers=headers
-                    )
+                    response = post_tool("generate-code", {
+                        "prompt": f"{task}: {prompt}",
+                        "language": language.lower(),
+                        "task": task,
+                        "start_session": True
+                    })
                     
                     if response.status_code == 200:
                         result = response.json()
                         if result["success"]:
                             st.success("Code generated successfully!")
+                            st.session_state.code_session = {"id": result.get("session_id"), "language": language.lower()}
                             
                             # Display the code
                             st.code(result["code"], language=language.lower())
@@ -360,6 +377,8 @@ else:
                     st.error(f"An error occurred: {str(e)}")
         elif submit:
             st.warning("Please describe what you need")
+
+        code_followup()
     
     elif current_tool == "Writing Tool":
         st.markdown("<h1 class='main-header'>AI Writing Tool</h1>", unsafe_allow_html=True)
@@ -374,21 +393,38 @@ else:
             instructions = st.text_area("Additional Instructions:", height=100, 
                                     placeholder="E.g., Include statistics and focus on recent advancements")
             
+            source = st.file_uploader("Document to summarize (for Summary):", type=["docx", "pptx", "txt", "md"])
+            
             format_type = st.selectbox("Output Format:", ["DOCX", "PDF", "Text"])
             
             submit = st.form_submit_button("Generate Document")
         
-        if submit and topic:
+        if submit and document_type == "Summary" and source:
+            with st.spinner("Summarizing your document..."):
+                try:
+                    response = post_tool("summarize-document",
+                                         {"instructions": instructions, "format": format_type.lower()}, upload=source)
+                    
+                    if response.status_code == 200:
+                        result = response.json()
+                        st.success("Document summarized successfully!")
+                        st.write(result["summary"])
+                        
+                        # Add download button
+                        file_path = result["file_path"]
+                        file_name = f"{os.path.splitext(source.name)[0]}_summary{os.path.splitext(file_path)[1]}"
+                        download_button(file_path, "Download Summary", file_name)
+                    else:
+                        st.error(f"API Error: {response.status_code}")
+                
+                except Exception as e:
+                    st.error(f"An error occurred: {str(e)}")
+        elif submit and topic:
             with st.spinner("Generating your document..."):
                 full_prompt = f"Write a {document_type} about {topic}. {instructions}"
                 
                 try:
-                    headers = {"Authorization": f"Bearer {st.session_state.token}"} if st.session_state.token else {}
-                    response = requests.post(
-                        f"{API_URL}/tools/generate-document",
-                        params={"prompt": full_prompt, "format": format_type.lower()},
-                        headers=headers
-                    )
+                    response = post_tool("generate-document", {"prompt": full_prompt, "format": format_type.lower()})
                     
                     if response.status_code == 200:
                         result = response.json()
@@ -431,12 +467,7 @@ else:
                 voice_id = voice.split(" ")[1].strip("()")
                 
                 try:
-                    headers = {"Authorization": f"Bearer {st.session_state.token}"} if st.session_state.token else {}
-                    response = requests.post(
-                        f"{API_URL}/tools/text-to-speech",
-                        params={"text": text, "voice": voice_id},
-                        headers=headers
-                    )
+                    response = post_tool("text-to-speech", {"text": text, "voice": voice_id})
                                            
                     if response.status_code == 200:
                         result = response.json()
@@ -502,16 +533,11 @@ else:
                     full_prompt = f"Create a {num_slides}-slide presentation about {topic}. {instructions}"
                     
                     try:
-                        headers = {"Authorization": f"Bearer {st.session_state.token}"} if "token" in st.session_state else {}
-                        response = requests.post(
-                            f"{API_URL}/tools/generate-presentation",
-                            params={
-                                "prompt": full_prompt, 
-                                "slides": num_slides,
-                                "template": template_map[template]
-                            },
-                            headers=headers
-                        )
+                        response = post_tool("generate-presentation", {
+                            "prompt": full_prompt,
+                            "slides": num_slides,
+                            "template": template_map[template]
+                        })
                         
                         if response.status_code == 200:
                             result = response.json()
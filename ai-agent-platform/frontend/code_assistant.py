@@ -1,10 +1,8 @@
 import streamlit as st
-import requests
 import os
-import base64
+from api import post_tool
+from widgets import download_button, code_followup
 
-# API endpoint
-API_URL = os.getenv("API_URL", "http://localhost:8000/api")
 
 def app():
     st.markdown("<h1 class='main-header'>AI Code Assistant</h1>", unsafe_allow_html=True)
@@ -29,17 +27,18 @@ def app():
     if submit and prompt:
         with st.spinner("Generating your code..."):
             try:
-                headers = {"Authorization": f"Bearer {st.session_state.token}"} if st.session_state.token else {}
-                response = requests.post(
-                    f"{API_URL}/tools/generate-code",
-                    params={"prompt": f"{task}: {prompt}", "language": language.lower()},
-                    headers=headers
-                )
+                response = post_tool("generate-code", {
+                    "prompt": f"{task}: {prompt}",
+                    "language": language.lower(),
+                    "task": task,
+                    "start_session": True
+                })
                 
                 if response.status_code == 200:
                     result = response.json()
                     if result["success"]:
                         st.success("Code generated successfully!")
+                        st.session_state.code_session = {"id": result.get("session_id"), "language": language.lower()}
                         
                         # Display the code
                         st.code(result["code"], language=language.lower())
@@ -58,15 +57,4 @@ def app():
     elif submit:
         st.warning("Please describe what you need")
 
-def download_button(file_path, button_text, file_name):
-    """Create a download button for a file"""
-    try:
-        with open(file_path, "rb") as file:
-            contents = file.read()
-        
-        b64 = base64.b64encode(contents).decode()
-        href = f'data:application/octet-stream;base64,{b64}'
-        return st.markdown(f'<a href="{href}" download="{file_name}" class="st-emotion-cache-1nf528h e1f1d6gn0">⬇️ {button_text}</a>', unsafe_allow_html=True)
-    except Exception as e:
-        st.error(f"Error creating download button: {str(e)}")
-        return None
+    code_followup()
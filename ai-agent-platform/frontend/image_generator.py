@@ -1,12 +1,9 @@
 import streamlit as st
-import requests
-import os
-import base64
 from PIL import Image
 from io import BytesIO
+from api import post_tool
+from widgets import download_button
 
-# API endpoint
-API_URL = os.getenv("API_URL", "http://localhost:8000/api")
 
 def app():
     st.markdown("<h1 class='main-header'>AI Image Generator</h1>", unsafe_allow_html=True)
@@ -29,12 +26,7 @@ def app():
     if submit and prompt:
         with st.spinner("Generating your image..."):
             try:
-                headers = {"Authorization": f"Bearer {st.session_state.token}"} if st.session_state.token else {}
-                response = requests.post(
-                    f"{API_URL}/tools/generate-image",
-                    params={"prompt": prompt, "style": style.lower()},
-                    headers=headers
-                )
+                response = post_tool("generate-image", {"prompt": prompt, "style": style.lower()})
                 
                 if response.status_code == 200:
                     result = response.json()
@@ -56,16 +48,3 @@ def app():
                 st.error(f"An error occurred: {str(e)}")
     elif submit:
         st.warning("Please enter a description for your image")
-
-def download_button(file_path, button_text, file_name):
-    """Create a download button for a file"""
-    try:
-        with open(file_path, "rb") as file:
-            contents = file.read()
-        
-        b64 = base64.b64encode(contents).decode()
-        href = f'data:application/octet-stream;base64,{b64}'
-        return st.markdown(f'<a href="{href}" download="{file_name}" class="st-emotion-cache-1nf528h e1f1d6gn0">⬇️ {button_text}</a>', unsafe_allow_html=True)
-    except Exception as e:
-        st.error(f"Error creating download button: {str(e)}")
-        return None
@@ -1,10 +1,7 @@
 import streamlit as st
-import requests
-import os
-import base64
+from api import post_tool
+from widgets import download_button
 
-# API endpoint
-API_URL = os.getenv("API_URL", "http://localhost:8000/api")
 
 def app():
     st.markdown("<h1 class='main-header'>AI PowerPoint Generator</h1>", unsafe_allow_html=True)
@@ -39,16 +36,11 @@ def app():
             full_prompt = f"Create a {num_slides}-slide presentation about {topic}. {instructions}"
             
             try:
-                headers = {"Authorization": f"Bearer {st.session_state.token}"} if "token" in st.session_state else {}
-                response = requests.post(
-                    f"{API_URL}/tools/generate-presentation",
-                    params={
-                        "prompt": full_prompt, 
-                        "slides": num_slides,
-                        "template": template_map[template]
-                    },
-                    headers=headers
-                )
+                response = post_tool("generate-presentation", {
+                    "prompt": full_prompt,
+                    "slides": num_slides,
+                    "template": template_map[template]
+                })
                 
                 if response.status_code == 200:
                     result = response.json()
@@ -82,16 +74,3 @@ def app():
                 st.error(f"An error occurred: {str(e)}")
     elif submit:
         st.warning("Please enter a topic for your presentation")
-
-def download_button(file_path, button_text, file_name):
-    """Create a download button for a file"""
-    try:
-        with open(file_path, "rb") as file:
-            contents = file.read()
-        
-        b64 = base64.b64encode(contents).decode()
-        href = f'data:application/octet-stream;base64,{b64}'
-        return st.markdown(f'<a href="{href}" download="{file_name}" class="st-emotion-cache-1nf528h e1f1d6gn0">⬇️ {button_text}</a>', unsafe_allow_html=True)
-    except Exception as e:
-        st.error(f"Error creating download button: {str(e)}")
-        return None
@@ -1,10 +1,7 @@
 import streamlit as st
-import requests
-import os
-import base64
+from api import post_tool
+from widgets import download_button
 
-# API endpoint
-API_URL = os.getenv("API_URL", "http://localhost:8000/api")
 
 def app():
     st.markdown("<h1 class='main-header'>AI Text-to-Speech</h1>", unsafe_allow_html=True)
@@ -28,12 +25,7 @@ def app():
             voice_id = voice.split(" ")[1].strip("()")
             
             try:
-                headers = {"Authorization": f"Bearer {st.session_state.token}"} if st.session_state.token else {}
-                response = requests.post(
-                    f"{API_URL}/tools/text-to-speech",
-                    params={"text": text, "voice": voice_id},
-                    headers=headers
-                )
+                response = post_tool("text-to-speech", {"text": text, "voice": voice_id})
                 
                 if response.status_code == 200:
                     result = response.json()
@@ -65,16 +57,3 @@ def app():
                 st.error(f"An error occurred: {str(e)}")
     elif submit:
         st.warning("Please enter text to convert to speech")
-
-def download_button(file_path, button_text, file_name):
-    """Create a download button for a file"""
-    try:
-        with open(file_path, "rb") as file:
-            contents = file.read()
-        
-        b64 = base64.b64encode(contents).decode()
-        href = f'data:application/octet-stream;base64,{b64}'
-        return st.markdown(f'<a href="{href}" download="{file_name}" class="st-emotion-cache-1nf528h e1f1d6gn0">⬇️ {button_text}</a>', unsafe_allow_html=True)
-    except Exception as e:
-        st.error(f"Error creating download button: {str(e)}")
-        return None
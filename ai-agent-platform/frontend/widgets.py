@@ -0,0 +1,60 @@
+"""Streamlit widgets shared by the pages"""
+import base64
+import os
+
+import streamlit as st
+
+from api import post_tool
+
+
+def download_button(file_path, button_text, file_name):
+    """Create a download button for a file"""
+    try:
+        with open(file_path, "rb") as file:
+            contents = file.read()
+        
+        b64 = base64.b64encode(contents).decode()
+        href = f'data:application/octet-stream;base64,{b64}'
+        return st.markdown(f'<a href="{href}" download="{file_name}" class="st-emotion-cache-1nf528h e1f1d6gn0">⬇️ {button_text}</a>', unsafe_allow_html=True)
+    except Exception as e:
+        st.error(f"Error creating download button: {str(e)}")
+        return None
+
+
+def code_followup():
+    """Follow-ups in the current code session: only the new request is sent,
+    the API keeps the conversation (summarizing older turns)"""
+    session = st.session_state.get("code_session")
+    if not session:
+        return
+
+    st.divider()
+    st.subheader("Follow-up")
+    st.caption("Ask for changes to the code above or paste an error message. No need to resend the code.")
+    with st.form("code_followup_form", clear_on_submit=True):
+        followup = st.text_area("Follow-up request:", height=120,
+                                placeholder="E.g., Add type hints and handle negative input")
+        send = st.form_submit_button("Send Follow-up")
+    if st.button("Start a New Session"):
+        st.session_state.code_session = None
+        st.rerun()
+
+    if send and followup:
+        with st.spinner("Updating your code..."):
+            try:
+                response = post_tool("generate-code", {
+                    "prompt": followup,
+                    "language": session["language"],
+                    "session_id": session["id"]
+                })
+                if response.status_code == 200:
+                    result = response.json()
+                    st.code(result["code"], language=session["language"])
+                    download_button(result["file_path"], "Download Code", os.path.basename(result["file_path"]))
+                elif response.status_code == 404:
+                    st.session_state.code_session = None
+                    st.warning("This session has expired. Please start a new one.")
+                else:
+                    st.error(f"API Error: {response.status_code}")
+            except Exception as e:
+                st.error(f"An error occurred: {str(e)}")
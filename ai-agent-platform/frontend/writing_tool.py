@@ -1,10 +1,8 @@
 import streamlit as st
-import requests
 import os
-import base64
+from api import post_tool
+from widgets import download_button
 
-# API endpoint
-API_URL = os.getenv("API_URL", "http://localhost:8000/api")
 
 def app():
     st.markdown("<h1 class='main-header'>AI Writing Tool</h1>", unsafe_allow_html=True)
@@ -19,21 +17,38 @@ def app():
         instructions = st.text_area("Additional Instructions:", height=100, 
                                 placeholder="E.g., Include statistics and focus on recent advancements")
         
+        source = st.file_uploader("Document to summarize (for Summary):", type=["docx", "pptx", "txt", "md"])
+        
         format_type = st.selectbox("Output Format:", ["DOCX", "PDF", "Text"])
         
         submit = st.form_submit_button("Generate Document")
     
-    if submit and topic:
+    if submit and document_type == "Summary" and source:
+        with st.spinner("Summarizing your document..."):
+            try:
+                response = post_tool("summarize-document",
+                                     {"instructions": instructions, "format": format_type.lower()}, upload=source)
+                
+                if response.status_code == 200:
+                    result = response.json()
+                    st.success("Document summarized successfully!")
+                    st.write(result["summary"])
+                    
+                    # Add download button
+                    file_path = result["file_path"]
+                    file_name = f"{os.path.splitext(source.name)[0]}_summary{os.path.splitext(file_path)[1]}"
+                    download_button(file_path, "Download Summary", file_name)
+                else:
+                    st.error(f"API Error: {response.status_code}")
+            
+            except Exception as e:
+                st.error(f"An error occurred: {str(e)}")
+    elif submit and topic:
         with st.spinner("Generating your document..."):
             full_prompt = f"Write a {document_type} about {topic}. {instructions}"
             
             try:
-                headers = {"Authorization": f"Bearer {st.session_state.token}"} if st.session_state.token else {}
-                response = requests.post(
-                    f"{API_URL}/tools/generate-document",
-                    params={"prompt": full_prompt, "format": format_type.lower()},
-                    headers=headers
-                )
+                response = post_tool("generate-document", {"prompt": full_prompt, "format": format_type.lower()})
                 
                 if response.status_code == 200:
                     result = response.json()
@@ -53,16 +68,3 @@ def app():
                 st.error(f"An error occurred: {str(e)}")
     elif submit:
         st.warning("Please enter a topic for your document")
-
-def download_button(file_path, button_text, file_name):
-    """Create a download button for a file"""
-    try:
-        with open(file_path, "rb") as file:
-            contents = file.read()
-        
-        b64 = base64.b64encode(contents).decode()
-        href = f'data:application/octet-stream;base64,{b64}'
-        return st.markdown(f'<a href="{href}" download="{file_name}" class="st-emotion-cache-1nf528h e1f1d6gn0">⬇️ {button_text}</a>', unsafe_allow_html=True)
-    except Exception as e:
-        st.error(f"Error creating download button: {str(e)}")
-        return None